@@ -0,0 +1,89 @@
+import numpy as np
+
+MONTHS = range(1, 13)
+
+
+def month_numbers(dates):
+    """Vectorized month (1-12) of each ISO `YYYY-MM-DD` date string."""
+    return np.array(dates, dtype="datetime64[M]").astype(np.int64) % 12 + 1
+
+
+def to_series(values):
+    """Convert an Open-Meteo value list to float64, with missing days (None) as NaN."""
+    return np.array(values, dtype=np.float64)
+
+
+def monthly_sums(months, values):
+    """Sum and count of `values` per month, ignoring NaN. Both arrays are indexed by month 0-12."""
+    valid = ~np.isnan(values)
+    counts = np.bincount(months[valid], minlength=13)
+    sums = np.bincount(months[valid], weights=values[valid], minlength=13)
+    return sums, counts
+
+
+def monthly_totals(dates, min_temps, max_temps):
+    """Running totals for both temperature series: {"min_temp": (sums, counts), "max_temp": (sums, counts)}."""
+    months = month_numbers(dates)
+    return {
+        "min_temp": monthly_sums(months, to_series(min_temps)),
+        "max_temp": monthly_sums(months, to_series(max_temps)),
+    }
+
+
+def add_totals(totals, delta, sign=1):
+    """Add (sign=1) or remove (sign=-1) the days summarized in `delta` from running `totals`."""
+    return {
+        key: (sums + sign * delta[key][0], counts + sign * delta[key][1])
+        for key, (sums, counts) in totals.items()
+    }
+
+
+def profiles_from_totals(totals):
+    """Average min/max temperature per month, rounded to 2 decimals, from `monthly_totals` output.
+
+    Only months with at least one reported value in both series are included.
+    """
+    min_sums, min_counts = totals["min_temp"]
+    max_sums, max_counts = totals["max_temp"]
+    return {
+        month: (
+            round(float(min_sums[month] / min_counts[month]), 2),
+            round(float(max_sums[month] / max_counts[month]), 2),
+        )
+        for month in MONTHS
+        if min_counts[month] and max_counts[month]
+    }
+
+
+def monthly_statistics(dates, values, percentiles=()):
+    """Per-month mean, min, max, standard deviation and requested percentiles of a daily series.
+
+    Missing days are ignored. Returns {month: {"count", "mean", "min", "max", "std", "p<N>"...}}
+    for every month with at least one value.
+    """
+    months = month_numbers(dates)
+    values = to_series(values)
+    valid = ~np.isnan(values)
+    months, values = months[valid], values[valid]
+
+    # Sort by month, then by value, so each month is one contiguous, sorted slice.
+    order = np.lexsort((values, months))
+    months, values = months[order], values[order]
+    boundaries = np.searchsorted(months, np.arange(1, 14))
+
+    statistics = {}
+    for month in MONTHS:
+        month_values = values[boundaries[month - 1]:boundaries[month]]
+        if not month_values.size:
+            continue
+        month_stats = {
+            "count": int(month_values.size),
+            "mean": round(float(month_values.mean()), 2),
+            "min": round(float(month_values[0]), 2),
+            "max": round(float(month_values[-1]), 2),
+            "std": round(float(month_values.std()), 2),
+        }
+        for percentile in percentiles:
+            month_stats[f"p{percentile:g}"] = round(float(np.percentile(month_values, percentile)), 2)
+        statistics[month] = month_stats
+    return statistics
@@ -0,0 +1,186 @@
+"""Compare the native Quart app against the previous Flask + WsgiToAsgi stack.
+
+Both stacks serve the same `/weather/monthly-profile` handler from a warm in-process
+cache, so the numbers reflect the serving stack rather than MongoDB or Open-Meteo.
+`quart-uncached` is the Quart app with the serialized response cache turned off.
+Each server runs in its own uvicorn process; the load generator runs in this one.
+
+Usage:
+    python bench/asgi_bench.py [--requests 5000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STACKS = {"flask-wsgi": 5101, "quart-uncached": 5103, "quart": 5102}
+BENCH_CITY = "Paris"
+BENCH_PATH = f"/weather/monthly-profile?city={BENCH_CITY}&month=7"
+REQUEST_TIMEOUT = 5
+
+
+def build_flask_app():
+    from flask import Flask, request, jsonify
+    from asgiref.wsgi import WsgiToAsgi
+    import services
+
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/weather/monthly-profile", methods=["GET"])
+    async def monthly_weather_profile():
+        route = "/weather/monthly-profile"
+        start_time = time.perf_counter()
+        error_occurred = False
+        try:
+            response = await services.monthly_weather_profile_service(
+                request.args.get("city"), request.args.get("month")
+            )
+            return jsonify(response)
+        except Exception as e:
+            error_occurred = True
+            return jsonify({"error": str(e)}), 400
+        finally:
+            services.track_metrics(route, time.perf_counter() - start_time, error_occurred)
+
+    return WsgiToAsgi(flask_app)
+
+
+def serve(stack, port):
+    if stack == "quart-uncached":
+        os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+    import uvicorn
+    import services
+    from series import location_key
+
+    lat, lon = 48.8534, 2.3488
+    location = location_key(lat, lon)
+    services.l1_cache.set(("geocode", services.normalize_city(BENCH_CITY), None), {
+        "lat": lat,
+        "lon": lon,
+        "fresh_until": float("inf"),
+    })
+    for month in range(1, 13):
+        services.l1_cache.set(("weather", location, month), {
+            "cache_type": "weather",
+            "city": location,
+            "name": services.normalize_city(BENCH_CITY),
+            "month": month,
+            "min_temp_avg": 10.0,
+            "max_temp_avg": 20.0,
+            "start_date": services.START_DATE,
+            "end_date": services.END_DATE,
+            "fresh_until": float("inf"),
+        })
+
+    if stack.startswith("quart"):
+        from main import app as asgi_app
+    else:
+        asgi_app = build_flask_app()
+    uvicorn.run(asgi_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(int(len(sorted_values) * percent / 100), len(sorted_values) - 1)]
+
+
+async def wait_until_up(client, url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def run_load(base_url, total_requests, concurrency, paths=(BENCH_PATH,), warmup=100):
+    """Send `total_requests` GETs, cycling through `paths`, after `warmup` untimed ones."""
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for index in range(total_requests):
+        queue.put_nowait(paths[index % len(paths)])
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=REQUEST_TIMEOUT) as client:
+        await wait_until_up(client, paths[0] if warmup else "/metrics")
+        for index in range(min(warmup, total_requests)):
+            try:
+                await client.get(paths[index % len(paths)])
+            except httpx.HTTPError:
+                pass
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--serve", choices=STACKS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    env = dict(os.environ, LOG_LEVEL="WARNING", METRICS_FLUSH_MAX_PENDING=str(10 ** 9))
+    print(f"{'stack':<15} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for stack, port in STACKS.items():
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", stack, "--port", str(port)],
+            cwd=ROOT,
+            env=env
+        )
+        try:
+            result = asyncio.run(run_load(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+        print(
+            f"{stack:<15} {result['rps']:>10.1f} {result['p50_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} {result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Measure cache lookup latency with a large number of cached entries.
+
+The in-process tier is always measured. The storage tier is measured through
+`services.check_cache` with the in-process tier turned off, so every lookup goes to the backend:
+the memory backend, and a scratch SQLite file with its primary key and, for comparison, with the
+index bypassed (`NOT INDEXED`, a full table scan). With --mongo, the same number of weather
+entries is written to a scratch collection next to the real cache (MONGO_URI/DB_NAME), and
+`find_one` lookups are timed with the production indexes and without them. The scratch
+collection is dropped afterwards.
+
+Usage:
+    python bench/cache_bench.py [--entries 100000] [--lookups 20000] [--scan-lookups 200] [--mongo]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pymongo import ASCENDING, DESCENDING
+
+BENCH_COLLECTION = "cache_bench"
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[min(int(len(sorted_values) * percent / 100), len(sorted_values) - 1)]
+
+
+def weather_doc(index, month):
+    return {
+        "cache_type": "weather",
+        "city": f"City {index}",
+        "month": month,
+        "min_temp_avg": 10.0,
+        "max_temp_avg": 20.0,
+        "fresh_until": time.time() + 3600,
+    }
+
+
+def report(name, latencies):
+    latencies.sort()
+    print(
+        f"{name:<24} {percentile(latencies, 50) * 1e6:>10.1f} {percentile(latencies, 99) * 1e6:>10.1f} "
+        f"{sum(latencies) / len(latencies) * 1e6:>10.1f}"
+    )
+
+
+def bench_l1(keys, lookups):
+    from cache import LRUCache
+
+    cache = LRUCache(max_entries=len(keys), default_ttl=3600)
+    for city, month in keys:
+        cache.set(("weather", city, month), weather_doc(0, month))
+
+    for name, lookup_keys in (
+        ("l1 hit", [("weather", *random.choice(keys)) for _ in range(lookups)]),
+        ("l1 miss", [("weather", "Nowhere", random.randint(1, 12)) for _ in range(lookups)]),
+    ):
+        latencies = []
+        for key in lookup_keys:
+            start = time.perf_counter()
+            cache.get(key)
+            latencies.append(time.perf_counter() - start)
+        report(name, latencies)
+
+
+async def bench_storage(keys, lookups, scan_lookups):
+    import services
+    from cache import LRUCache
+    from storage import MemoryStorage, SQLiteStorage
+
+    services.l1_cache = LRUCache(max_entries=0)
+    cities = {}
+    for city, month in keys:
+        cities.setdefault(city, []).append({**weather_doc(0, month), "city": city})
+
+    async def timed_lookups(name, lookup, count):
+        latencies = []
+        for _ in range(count):
+            city, month = random.choice(keys)
+            start = time.perf_counter()
+            assert await lookup(city, month)
+            latencies.append(time.perf_counter() - start)
+        report(name, latencies)
+
+    async def check_cache(city, month):
+        return await services.check_cache("weather", city, month)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in (MemoryStorage(), SQLiteStorage(os.path.join(directory, "bench.sqlite3"))):
+            services.storage = backend
+            await backend.ensure_indexes()
+            for city, docs in cities.items():
+                await backend.save_weather(city, docs)
+            await timed_lookups(f"{backend.name} check_cache", check_cache, lookups)
+            if isinstance(backend, SQLiteStorage):
+                def scan(city, month):
+                    return backend._connect().execute(
+                        "SELECT doc, hits FROM cache NOT INDEXED WHERE cache_type = ? AND city = ? AND month = ?",
+                        ("weather", city, month)
+                    ).fetchall()
+
+                async def unindexed(city, month):
+                    return await backend._run(scan, city, month)
+
+                await timed_lookups("sqlite no index", unindexed, scan_lookups)
+            await backend.close()
+
+
+async def bench_mongo(keys, lookups):
+    from config import create_mongo_client, DB_NAME
+
+    client = create_mongo_client()
+    collection = client[DB_NAME][BENCH_COLLECTION]
+    await collection.drop()
+    try:
+        for offset in range(0, len(keys), 10000):
+            await collection.insert_many([
+                {**weather_doc(0, month), "city": city}
+                for city, month in keys[offset:offset + 10000]
+            ], ordered=False)
+
+        async def timed_lookups(name):
+            latencies = []
+            for _ in range(lookups):
+                city, month = random.choice(keys)
+                start = time.perf_counter()
+                await collection.find_one({"cache_type": "weather", "city": city, "month": month}, {"_id": 0})
+                latencies.append(time.perf_counter() - start)
+            report(name, latencies)
+
+        await timed_lookups("mongo no index")
+
+        await collection.create_index(
+            [("cache_type", ASCENDING), ("city", ASCENDING), ("month", ASCENDING)], unique=True, name="cache_key"
+        )
+        await collection.create_index("expires_at", expireAfterSeconds=0, name="cache_expiry")
+        await collection.create_index([("cache_type", ASCENDING), ("hits", DESCENDING)], name="cache_hits")
+        city, month = keys[0]
+        plan = await collection.find({"cache_type": "weather", "city": city, "month": month}).explain()
+        stage = plan["queryPlanner"]["winningPlan"]
+        while "inputStage" in stage:
+            stage = stage["inputStage"]
+        await timed_lookups(f"mongo indexed ({stage['stage']})")
+    finally:
+        await collection.drop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--scan-lookups", type=int, default=200, help="lookups for the slow unindexed SQLite case")
+    parser.add_argument("--mongo", action="store_true", help="also benchmark MongoDB lookups")
+    args = parser.parse_args()
+
+    cities = (args.entries + 11) // 12
+    keys = [(f"City {index}", month) for index in range(cities) for month in range(1, 13)][:args.entries]
+    print(f"{len(keys)} cached entries, {args.lookups} lookups")
+    print(f"{'lookup':<24} {'p50 us':>10} {'p99 us':>10} {'mean us':>10}")
+    bench_l1(keys, args.lookups)
+    asyncio.run(bench_storage(keys, args.lookups, args.scan_lookups))
+    if args.mongo:
+        asyncio.run(bench_mongo(keys, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
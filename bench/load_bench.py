@@ -0,0 +1,158 @@
+"""End-to-end load test of every read endpoint, fully offline.
+
+Open-Meteo is replaced by bench/openmeteo_stub.py and MongoDB by the memory or SQLite storage
+backend, so the run needs no network and no database. For each backend the app is started with
+uvicorn and each endpoint is measured in phases:
+
+- cold: every request names cities that were never requested, so it geocodes and fetches archives
+  from the stub and writes them to storage;
+- warm: the same requests again, served from the in-process cache;
+- restart (sqlite only): the app is restarted on the same database file, so the in-process cache
+  is empty and requests are served from storage.
+
+Usage:
+    python bench/load_bench.py [--cities 100] [--requests 2000] [--concurrency 20]
+                               [--latency-ms 50] [--backends memory,sqlite]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from asgi_bench import ROOT, run_load, wait_until_up
+
+STUB_PORT = 5301
+APP_PORT = 5302
+
+
+def endpoint_paths(cities):
+    """Paths per endpoint; each endpoint gets its own city names so its cold phase is really cold."""
+    def names(tag):
+        return [f"{tag} City {index}" for index in range(cities)]
+
+    return {
+        "monthly-profile": [
+            f"/weather/monthly-profile?city={city}&month={index % 12 + 1}"
+            for index, city in enumerate(names("Profile"))
+        ],
+        "monthly-stats": [
+            f"/weather/monthly-stats?city={city}&month={index % 12 + 1}"
+            for index, city in enumerate(names("Stats"))
+        ],
+        "best-month": [
+            f"/travel/best-month?city={city}&min_temp=15&max_temp=25"
+            for city in names("Best")
+        ],
+        "compare-cities": [
+            f"/travel/compare-cities?cities={','.join(group)}&month=7"
+            for group in zip(*[iter(names("Compare"))] * 3)
+        ],
+        "search": [f"/travel/search?month={month}&min_temp=10&max_temp=30" for month in range(1, 13)],
+    }
+
+
+def start_process(args, env):
+    return subprocess.Popen(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def start_app(env):
+    return start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(APP_PORT),
+         "--log-level", "warning"],
+        env
+    )
+
+
+async def measure(paths, phase, requests, concurrency):
+    results = {}
+    for endpoint, urls in paths.items():
+        total = len(urls) if phase == "cold" else max(requests, len(urls))
+        results[endpoint] = await run_load(
+            f"http://127.0.0.1:{APP_PORT}", total, concurrency, paths=urls, warmup=0
+        )
+    return results
+
+
+async def stub_requests():
+    async with httpx.AsyncClient() as client:
+        await wait_until_up(client, f"http://127.0.0.1:{STUB_PORT}/stats")
+        return (await client.get(f"http://127.0.0.1:{STUB_PORT}/stats")).json()
+
+
+def print_results(backend, phase, results):
+    for endpoint, result in results.items():
+        print(
+            f"{backend:<8} {phase:<8} {endpoint:<16} {result['requests']:>8} {result['rps']:>9.1f} "
+            f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7}"
+        )
+
+
+def run_backend(backend, args, paths, data_dir):
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND=backend,
+        SQLITE_PATH=os.path.join(data_dir, f"{backend}.sqlite3"),
+        GEOCODING_API_URL=f"http://127.0.0.1:{STUB_PORT}/v1/search",
+        ARCHIVE_API_URL=f"http://127.0.0.1:{STUB_PORT}/v1/archive",
+        LOG_LEVEL="WARNING",
+        WARMUP_TOP_CITIES="0",
+        WARMUP_CITIES="",
+        METRICS_FLUSH_MAX_PENDING=str(10 ** 9),
+    )
+    phases = ["cold", "warm"] + (["restart"] if backend == "sqlite" else [])
+    app = start_app(env)
+    try:
+        for phase in phases:
+            if phase == "restart":
+                stop_process(app)
+                app = start_app(env)
+            print_results(backend, phase, asyncio.run(measure(paths, phase, args.requests, args.concurrency)))
+    finally:
+        stop_process(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", type=int, default=100, help="distinct cities per endpoint")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint in the warm phases")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="artificial Open-Meteo latency")
+    parser.add_argument("--backends", default="memory,sqlite")
+    args = parser.parse_args()
+
+    paths = endpoint_paths(args.cities)
+    stub = start_process(
+        [sys.executable, os.path.join(BENCH_DIR, "openmeteo_stub.py"), "--port", str(STUB_PORT),
+         "--latency-ms", str(args.latency_ms)],
+        os.environ
+    )
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            print(
+                f"{'backend':<8} {'phase':<8} {'endpoint':<16} {'requests':>8} {'req/s':>9} "
+                f"{'p50 ms':>9} {'p99 ms':>9} {'errors':>7}"
+            )
+            for backend in args.backends.split(","):
+                run_backend(backend.strip(), args, paths, data_dir)
+        print(f"Open-Meteo stub requests: {asyncio.run(stub_requests())}")
+    finally:
+        stop_process(stub)
+
+
+if __name__ == "__main__":
+    main()
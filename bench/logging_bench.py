@@ -0,0 +1,88 @@
+"""Compare request throughput with queued logging against handlers writing on the event loop.
+
+The Quart app is served by uvicorn (as in asgi_bench.py) at LOG_LEVEL=INFO, once with
+LOG_QUEUE=false (file and stream handlers called directly from request handlers) and once
+with LOG_QUEUE=true (records handed to a background writer thread). Server output goes
+to a temporary file, or with --sink-kbps to a pipe drained at that rate, like a log shipper
+that falls behind. Also times a disabled DEBUG call with an f-string message against a lazily
+formatted one.
+
+Usage:
+    python bench/logging_bench.py [--requests 5000] [--concurrency 50] [--sink-kbps 50]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from asgi_bench import ROOT, run_load
+
+MODES = {"sync": ("false", 5201), "queue": ("true", 5202)}
+
+
+def bench_disabled_level(number=1_000_000):
+    logger = logging.getLogger("logging_bench")
+    logger.setLevel(logging.INFO)
+    city, month, elapsed_time = "Paris", 7, 0.0123
+    eager = timeit.timeit(
+        lambda: logger.debug(f"Weather cache hit for {city}-{month} in {elapsed_time:.2f} seconds"), number=number
+    )
+    lazy = timeit.timeit(
+        lambda: logger.debug("Weather cache hit for %s-%s in %.2f seconds", city, month, elapsed_time), number=number
+    )
+    print(f"disabled debug call: f-string {eager / number * 1e9:.0f} ns, lazy {lazy / number * 1e9:.0f} ns")
+
+
+def drain(pipe, kbps):
+    """Read server output at most `kbps` KB per second, until the server exits."""
+    while pipe.read(1024):
+        time.sleep(1 / kbps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sink-kbps", type=float, help="drain server output through a pipe at this rate")
+    args = parser.parse_args()
+
+    bench_disabled_level()
+    print(f"{'logging':<12} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for mode, (use_queue, port) in MODES.items():
+        with tempfile.TemporaryDirectory() as log_dir, open(os.path.join(log_dir, "server.out"), "w") as output:
+            env = dict(os.environ, LOG_LEVEL="INFO", LOG_QUEUE=use_queue, METRICS_FLUSH_MAX_PENDING=str(10 ** 9))
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(BENCH_DIR, "asgi_bench.py"), "--serve", "quart", "--port", str(port)],
+                cwd=ROOT,
+                env=env,
+                stdout=subprocess.PIPE if args.sink_kbps else output,
+                stderr=subprocess.STDOUT
+            )
+            if args.sink_kbps:
+                threading.Thread(target=drain, args=(server.stdout, args.sink_kbps), daemon=True).start()
+            try:
+                result = asyncio.run(run_load(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+            finally:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+        print(
+            f"{mode:<12} {result['rps']:>10.1f} {result['p50_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} {result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""A local stand-in for the Open-Meteo geocoding and archive APIs.
+
+Answers are deterministic: a city's coordinates are derived from its name, and its daily
+temperatures follow a seasonal curve set by the latitude, so repeated runs fetch identical
+data. A day's values don't depend on the requested range, so incremental fetches agree with
+full ones (see bench/window_check.py). Names starting with "Nowhere" are not found. Responses
+have the same shape and size as the real ones, after an optional artificial delay (--latency-ms).
+
+Point the app at it with
+    GEOCODING_API_URL=http://127.0.0.1:5301/v1/search
+    ARCHIVE_API_URL=http://127.0.0.1:5301/v1/archive
+
+Usage:
+    python bench/openmeteo_stub.py [--port 5301] [--latency-ms 50]
+"""
+import argparse
+import asyncio
+import hashlib
+import numpy as np
+from quart import Quart, request, jsonify
+
+NOT_FOUND_PREFIX = "nowhere"
+
+stub = Quart(__name__)
+stub.config["LATENCY"] = 0.0
+stub.config["REQUESTS"] = {"geocoding": 0, "archive": 0}
+
+
+def city_coordinates(name):
+    digest = hashlib.sha256(name.strip().lower().encode()).digest()
+    lat = int.from_bytes(digest[:4], "big") / 2 ** 32 * 140 - 70
+    lon = int.from_bytes(digest[4:8], "big") / 2 ** 32 * 360 - 180
+    return round(lat, 4), round(lon, 4)
+
+
+def daily_temperatures(lat, lon, start_date, end_date):
+    dates = np.arange(np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1)
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype(np.int64)
+    # Warmest in July in the northern hemisphere, in January in the southern one.
+    season = np.cos((day_of_year - 196) / 365.25 * 2 * np.pi) * (1 if lat >= 0 else -1)
+    mean = 28 - abs(lat) * 0.45 + season * (4 + abs(lat) * 0.2)
+    # Keyed on the absolute day, so a day has the same value whatever range it is requested in.
+    noise = np.sin(dates.astype(np.int64) * 0.7 + lon) * 2
+    return {
+        "time": dates.astype(str).tolist(),
+        "temperature_2m_min": np.round(mean - 5 + noise, 1).tolist(),
+        "temperature_2m_max": np.round(mean + 5 + noise, 1).tolist(),
+    }
+
+
+@stub.before_request
+async def delay():
+    if stub.config["LATENCY"]:
+        await asyncio.sleep(stub.config["LATENCY"])
+
+
+@stub.route("/v1/search")
+async def search():
+    stub.config["REQUESTS"]["geocoding"] += 1
+    name = request.args.get("name", "")
+    if not name or name.strip().lower().startswith(NOT_FOUND_PREFIX):
+        return jsonify({"generationtime_ms": 0.1})
+    lat, lon = city_coordinates(name)
+    return jsonify({"results": [{"name": name, "latitude": lat, "longitude": lon}], "generationtime_ms": 0.1})
+
+
+@stub.route("/v1/archive")
+async def archive():
+    stub.config["REQUESTS"]["archive"] += 1
+    try:
+        lat = float(request.args["latitude"])
+        lon = float(request.args["longitude"])
+        daily = daily_temperatures(lat, lon, request.args["start_date"], request.args["end_date"])
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": True, "reason": f"Invalid parameters: {e}"}), 400
+    return jsonify({"latitude": lat, "longitude": lon, "timezone": "UTC", "daily": daily})
+
+
+@stub.route("/stats")
+async def stats():
+    return jsonify(stub.config["REQUESTS"])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5301)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub.config["LATENCY"] = args.latency_ms / 1000
+    uvicorn.run(stub, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Check that moving the date window updates cached averages exactly like a full recompute.
+
+Runs the app's own fetch path against bench/openmeteo_stub.py's data (in process, no server)
+three times, each in a fresh process so START_DATE/END_DATE are read from the environment:
+
+1. the old window, on a new SQLite file;
+2. the shifted window, on the same file, so the running totals and stored series are updated
+   with only the days that entered or left the window (incremental);
+3. the shifted window, on an empty memory store (full download and recompute).
+
+The averages of runs 2 and 3 must match exactly. This relies on the stub returning the same
+value for a day whatever range it is requested in.
+
+Usage:
+    python bench/window_check.py [--cities 20] [--shift-days 45]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from asgi_bench import ROOT
+
+OLD_WINDOW = ("2018-01-01", "2023-12-31")
+
+
+def shifted(window, days):
+    return tuple((date.fromisoformat(day) + timedelta(days=days)).isoformat() for day in window)
+
+
+async def compute_profiles(cities):
+    """Run inside a child process: fetch every city's monthly averages through services."""
+    sys.path.insert(0, ROOT)
+    import httpx
+    import services
+    from openmeteo_stub import city_coordinates, daily_temperatures
+
+    archive_ranges = []
+
+    async def handler(request):
+        params = request.url.params
+        if request.url.path.endswith("/search"):
+            lat, lon = city_coordinates(params["name"])
+            return httpx.Response(200, json={"results": [{"latitude": lat, "longitude": lon}]})
+        archive_ranges.append((params["start_date"], params["end_date"]))
+        daily = daily_temperatures(float(params["latitude"]), float(params["longitude"]), params["start_date"], params["end_date"])
+        return httpx.Response(200, json={"daily": daily})
+
+    services.upstream_client.transport = httpx.MockTransport(handler)
+    await services.prepare_storage()
+    try:
+        profiles = {
+            city: {month: list(values) for month, values in (await services.get_all_weather_data(city)).items()}
+            for city in cities
+        }
+    finally:
+        await services.upstream_client.aclose()
+        await services.storage.close()
+    return {"profiles": profiles, "archive_ranges": sorted(set(archive_ranges))}
+
+
+def run(window, backend, sqlite_path, cities):
+    env = dict(
+        os.environ,
+        START_DATE=window[0],
+        END_DATE=window[1],
+        STORAGE_BACKEND=backend,
+        SQLITE_PATH=sqlite_path,
+        LOG_LEVEL="WARNING",
+        LOG_DIR=os.path.join(os.path.dirname(sqlite_path), "logs"),
+        GEOCODING_API_URL="http://stub/v1/search",
+        ARCHIVE_API_URL="http://stub/v1/archive",
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(cities)],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--shift-days", type=int, default=45)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(compute_profiles(json.loads(args.child)))))
+        return
+
+    cities = [f"window city {index}" for index in range(args.cities)]
+    new_window = shifted(OLD_WINDOW, args.shift_days)
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_path = os.path.join(directory, "window.sqlite3")
+        run(OLD_WINDOW, "sqlite", sqlite_path, cities)
+        incremental = run(new_window, "sqlite", sqlite_path, cities)
+        full = run(new_window, "memory", sqlite_path, cities)
+
+    print(f"window {OLD_WINDOW[0]}..{OLD_WINDOW[1]} -> {new_window[0]}..{new_window[1]}, {len(cities)} cities")
+    print(f"incremental archive requests: {incremental['archive_ranges']}")
+    mismatches = [
+        (city, month, values, full["profiles"][city][month])
+        for city, months in incremental["profiles"].items()
+        for month, values in months.items()
+        if values != full["profiles"][city][month]
+    ]
+    for city, month, values, expected in mismatches[:10]:
+        print(f"MISMATCH {city} month {month}: incremental {values}, full {expected}")
+    print(f"{len(mismatches)} mismatched monthly averages")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
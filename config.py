@@ -1,43 +1,97 @@
 import os
-import logging
-from bson import ObjectId
 from dotenv import load_dotenv
-from flask import Flask
-from motor.motor_asyncio import AsyncIOMotorClient
-from asgiref.wsgi import WsgiToAsgi
 
+# Settings only: importing this module has no side effects beyond reading the environment.
+# Logging is configured by main.create_app, and clients are created on first use.
 load_dotenv()
 
-app = Flask(__name__)
-asgi_app = WsgiToAsgi(app)
-
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
-
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
-)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_QUEUE = os.getenv('LOG_QUEUE', 'true').lower() in ('1', 'true', 'yes')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
 
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 DB_NAME = os.getenv('DB_NAME', 'kubiya')
+# Where the cache, daily series and metrics live: mongo, sqlite (a local file) or memory (per process).
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongo').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'data/weather.sqlite3')
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '5000'))
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+METRICS_DOCUMENT_ID = os.getenv('METRICS_DOCUMENT_ID', '674d77e62034f74473b1e65f')
+
+
+def create_mongo_client():
+    """Create the Motor client. Called on first use inside a worker's event loop, never at import."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(MONGO_URI)
+
+
+START_DATE = os.getenv('START_DATE', '2018-01-01')
+END_DATE = os.getenv('END_DATE', '2023-12-31')
+
+GEOCODING_API_URL = os.getenv('GEOCODING_API_URL', 'https://geocoding-api.open-meteo.com/v1/search')
+ARCHIVE_API_URL = os.getenv('ARCHIVE_API_URL', 'https://archive-api.open-meteo.com/v1/archive')
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', '30'))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '20'))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '10'))
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '3'))
+UPSTREAM_BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', '0.5'))
+UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', '10'))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs/profiles')
+
+L1_CACHE_MAX_ENTRIES = int(os.getenv('L1_CACHE_MAX_ENTRIES', '50000'))
+L1_CACHE_TTL = float(os.getenv('L1_CACHE_TTL', '3600'))
+L1_NEGATIVE_CACHE_TTL = float(os.getenv('L1_NEGATIVE_CACHE_TTL', '300'))
+
+# Serialized GET responses, and how long clients and CDNs may reuse them (Cache-Control max-age).
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '86400'))
+
+# Cache entries are served as-is until their fresh TTL, then served stale while one background
+# refresh updates them, and deleted by MongoDB once their expire TTL passes without a refresh.
+GEOCODE_FRESH_TTL = float(os.getenv('GEOCODE_FRESH_TTL', str(30 * 86400)))
+GEOCODE_EXPIRE_TTL = float(os.getenv('GEOCODE_EXPIRE_TTL', str(365 * 86400)))
+WEATHER_FRESH_TTL = float(os.getenv('WEATHER_FRESH_TTL', str(30 * 86400)))
+WEATHER_EXPIRE_TTL = float(os.getenv('WEATHER_EXPIRE_TTL', str(180 * 86400)))
+# Open-Meteo may still revise archive days this recent; older days are final and never re-downloaded.
+ARCHIVE_REVISION_DAYS = int(os.getenv('ARCHIVE_REVISION_DAYS', '92'))
+
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_FLUSH_MAX_PENDING = int(os.getenv('METRICS_FLUSH_MAX_PENDING', '1000'))
+METRICS_DIR = os.getenv('METRICS_DIR', 'logs/metrics')
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', '1'))
+METRICS_SNAPSHOT_MAX_AGE = float(os.getenv('METRICS_SNAPSHOT_MAX_AGE', '300'))
+
+FANOUT_LIMIT = int(os.getenv('FANOUT_LIMIT', '5'))
+FANOUT_ITEM_TIMEOUT = float(os.getenv('FANOUT_ITEM_TIMEOUT', '30'))
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100'))
 
-try:
-    client = AsyncIOMotorClient(MONGO_URI)
-    logging.info("Connected to MongoDB successfully.")
-except Exception as e:
-    logging.info(f"Failed to connect to MongoDB: {str(e)}")
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '100'))
+# Each worker reloads the weather entries cached since its last load (by any worker) this often; 0 disables.
+PROFILE_INDEX_RELOAD_INTERVAL = float(os.getenv('PROFILE_INDEX_RELOAD_INTERVAL', '30'))
+# Storage setup and the search index load are retried after 1, 2, 4... seconds, up to this delay, until storage answers.
+STARTUP_RETRY_MAX = float(os.getenv('STARTUP_RETRY_MAX', '60'))
 
-db = client[DB_NAME]
-metrics_collection = db["metrics"]
-metrics_objectID = ObjectId("674d77e62034f74473b1e65f")
-cache_collection = db["cache"]
+WARMUP_CITIES = [city.strip() for city in os.getenv('WARMUP_CITIES', '').split(',') if city.strip()]
+WARMUP_TOP_CITIES = int(os.getenv('WARMUP_TOP_CITIES', '50'))
+WARMUP_INTERVAL = float(os.getenv('WARMUP_INTERVAL', '1'))
+# Warm-up runs in the worker holding this storage lease, renewed before each city.
+WARMUP_LEASE_TTL = float(os.getenv('WARMUP_LEASE_TTL', '60'))
 
-START_DATE = "2018-01-01"
-END_DATE = "2023-12-31"
+HEALTH_CHECK_TTL = float(os.getenv('HEALTH_CHECK_TTL', '10'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', '2'))
+# The Open-Meteo probe is a real geocoding request that counts against the API quota.
+UPSTREAM_CHECK_TTL = float(os.getenv('UPSTREAM_CHECK_TTL', '300'))
+READY_REQUIRE_WARMUP = os.getenv('READY_REQUIRE_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+READY_REQUIRE_UPSTREAM = os.getenv('READY_REQUIRE_UPSTREAM', 'false').lower() in ('1', 'true', 'yes')
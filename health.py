@@ -0,0 +1,77 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from utils import SingleFlight
+
+
+class CachedCheck:
+    """Runs an async dependency check at most once per `ttl` seconds.
+
+    Probes arriving while the cached result is fresh get it without any I/O, and concurrent
+    probes after it expires share a single run, which is bounded by `timeout` seconds.
+
+    `observed`, if given, returns a passively observed result and its monotonic time (from real
+    traffic to the dependency); a recent enough observation counts as a fresh result, so the
+    dependency is only probed when it has seen no traffic for `ttl` seconds.
+    """
+
+    def __init__(self, check, ttl, timeout, observed=None):
+        self.check = check
+        self.ttl = ttl
+        self.timeout = timeout
+        self.observed = observed
+        self._result = None
+        self._checked_at = 0.0
+        self._in_flight = SingleFlight()
+
+    def _latest(self):
+        if self.observed is not None:
+            observed, observed_at = self.observed()
+            if observed is not None and observed_at > self._checked_at:
+                return observed, observed_at
+        return self._result, self._checked_at
+
+    def last_result(self):
+        """The most recent result, probed or observed, or None if there is none. Never triggers a check."""
+        return self._latest()[0]
+
+    async def result(self):
+        result, checked_at = self._latest()
+        if result is None or time.monotonic() - checked_at >= self.ttl:
+            await self._in_flight.do("check", self._run)
+        return self._latest()[0]
+
+    async def _run(self):
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.check(), self.timeout)
+            result = {"ok": True}
+        except Exception as e:
+            result = {"ok": False, "error": str(e) or type(e).__name__}
+        result["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+        result["checked_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        result["source"] = "probe"
+        self._result = result
+        self._checked_at = time.monotonic()
+
+
+class StartupTimings:
+    """Seconds from the start of the main module import to each startup milestone of this worker."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.milestones = {}
+
+    def start(self, started):
+        self.started = started
+
+    def mark(self, milestone):
+        if milestone not in self.milestones:
+            self.milestones[milestone] = round(time.perf_counter() - self.started, 4)
+        return self.milestones[milestone]
+
+    def snapshot(self):
+        return dict(self.milestones)
+
+
+startup_timings = StartupTimings()
@@ -0,0 +1,79 @@
+import hashlib
+import json
+from cache import LRUCache
+from openmetrics import registry
+from config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, HTTP_CACHE_MAX_AGE
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps(payload):
+    """Serialize a response payload to compact JSON bytes with sorted keys, like jsonify, using orjson if installed."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload, default=float, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=float, sort_keys=True, separators=(",", ":")).encode()
+
+
+def text(value):
+    """A required string parameter, kept as given because responses echo it."""
+    if value is None:
+        raise TypeError("missing parameter")
+    return value
+
+
+def float_list(value):
+    """An optional comma-separated list of numbers."""
+    return tuple(float(item) for item in value.split(",")) if value else ()
+
+
+def query_key(route, args, **parsers):
+    """Response cache key: the route and its parameters, each parsed by its parser, so that equivalent
+    queries (`month=07` and `month=7`, any parameter order, unknown parameters) share one entry.
+
+    Returns None if a parameter is missing or doesn't parse; such requests fail validation and are
+    never cached.
+    """
+    try:
+        return (route, *(parser(args.get(name)) for name, parser in parsers.items()))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResponseCache:
+    """Bounded cache of serialized JSON responses with their strong ETags.
+
+    A hit skips the service call, the dict building and the JSON encoding entirely; the body
+    bytes are sent as they are, or not at all when the client already holds the same ETag.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL, max_age=HTTP_CACHE_MAX_AGE):
+        self.cache_control = f"public, max-age={max_age}"
+        self._entries = LRUCache(max_entries, ttl)
+
+    def get(self, key):
+        if key is None or self._entries.max_entries <= 0:
+            return None
+        cached = self._entries.get(key)
+        registry.inc("weather_cache_lookups", cache_type="response", tier="l1", result="miss" if cached is None else "hit")
+        return cached
+
+    def put(self, key, payload):
+        """Serialize `payload` and cache it under `key` (unless None). Returns (body, etag)."""
+        body = dumps(payload)
+        response = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        if key is not None and self._entries.max_entries > 0:
+            self._entries.set(key, response)
+        return response
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+
+response_cache = ResponseCache()
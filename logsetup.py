@@ -0,0 +1,122 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, and the traceback if any."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records for the listener thread, formatting only the message on the calling thread.
+
+    The stock QueueHandler formats the whole record (timestamp, traceback, JSON) before queueing.
+    Here only `msg % args` is resolved, so mutable arguments are captured as they were, and the
+    rest of the formatting and all I/O happen on the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        """Drop records instead of blocking the event loop when the writer can't keep up."""
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {self.dropped} log records while the log writer was behind",
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() can be called more than once (explicitly and again at exit)."""
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def build_handlers(path, log_format, max_bytes, backup_count, rotate_when):
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [file_handler, logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(
+    level,
+    path,
+    log_format="text",
+    max_bytes=0,
+    backup_count=0,
+    rotate_when=None,
+    use_queue=True,
+    queue_size=10000
+):
+    """Route all log records through a bounded queue to a background writer thread.
+
+    Returns the started QueueListener (None when `use_queue` is off and handlers write directly).
+    """
+    handlers = build_handlers(path, log_format, max_bytes, backup_count, rotate_when)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if not use_queue:
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    log_queue = queue.Queue(queue_size)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    listener = LogListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_file_path(directory, workers):
+    """Each worker process writes its own file when there may be several, since rotation isn't multi-process safe.
+
+    Besides WEB_CONCURRENCY, this catches workers spawned by `uvicorn --workers N` (or `--reload`), which
+    are multiprocessing children of the supervisor and never see the worker count.
+    """
+    if workers > 1 or multiprocessing.parent_process() is not None:
+        return os.path.join(directory, f"app-{os.getpid()}.log")
+    return os.path.join(directory, "app.log")
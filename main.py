@@ -1,10 +1,83 @@
-import os
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import logging
-from asgiref.wsgi import WsgiToAsgi
+import os
 import uvicorn
-from config import app, asgi_app 
+from quart import Quart
+from config import (
+    HOST,
+    PORT,
+    WEB_CONCURRENCY,
+    METRICS_DIR,
+    LOG_DIR,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_ROTATE_WHEN,
+    LOG_QUEUE,
+    LOG_QUEUE_SIZE
+)
+from logsetup import configure_logging, log_file_path
+from openmetrics import remove_snapshots
+from health import startup_timings
 import routes
 
+startup_timings.start(IMPORT_STARTED)
+startup_timings.mark("imported")
+logging_configured = False
+
+
+def setup_logging():
+    global logging_configured
+    if logging_configured:
+        return
+    os.makedirs(LOG_DIR, exist_ok=True)
+    configure_logging(
+        getattr(logging, LOG_LEVEL),
+        log_file_path(LOG_DIR, WEB_CONCURRENCY),
+        log_format=LOG_FORMAT,
+        max_bytes=LOG_MAX_BYTES,
+        backup_count=LOG_BACKUP_COUNT,
+        rotate_when=LOG_ROTATE_WHEN,
+        use_queue=LOG_QUEUE,
+        queue_size=LOG_QUEUE_SIZE
+    )
+    logging_configured = True
+
+
+def create_app():
+    """Build the Quart app: configure logging and register the routes.
+
+    Nothing connects here. The MongoDB and Open-Meteo clients are created on first use, and
+    index creation, migrations and warm-up run in the background once the server is listening
+    (see /readyz).
+    """
+    setup_logging()
+    app = Quart(__name__)
+    app.register_blueprint(routes.bp)
+    logging.info(
+        "App created %.3fs after start (imports took %.3fs).",
+        startup_timings.mark("app_created"), startup_timings.milestones["imported"]
+    )
+    return app
+
+
+app = create_app()
+
 if __name__ == "__main__":
-    logging.info("Starting Flask app with Uvicorn...")
-    uvicorn.run(asgi_app, host="0.0.0.0", port=5000, log_level="info")
+    # Snapshots left by a previous run's workers would otherwise be summed into the new ones.
+    remove_snapshots(METRICS_DIR)
+    logging.info("Starting Quart app with Uvicorn (%s worker(s))...", WEB_CONCURRENCY)
+    # A single worker serves the app built above; with several, each worker imports main:app itself.
+    # log_config=None leaves Uvicorn's loggers (including the access log) to the queued root handlers.
+    uvicorn.run(
+        app if WEB_CONCURRENCY == 1 else "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        log_level="info",
+        log_config=None
+    )
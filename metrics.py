@@ -0,0 +1,177 @@
+import asyncio
+import math
+
+# Log-scale latency histogram: bucket i covers (HISTOGRAM_MIN * GROWTH**(i-1), HISTOGRAM_MIN * GROWTH**i],
+# bucket 0 covers everything up to HISTOGRAM_MIN and the last bucket everything above its lower bound.
+# With a growth factor of 2**0.25 every estimate is within ~10% of the true value, and 96 buckets
+# span 100µs to ~20 minutes, so a route's histogram never holds more than 96 counters.
+HISTOGRAM_MIN = 1e-4
+HISTOGRAM_GROWTH = 2 ** 0.25
+HISTOGRAM_BUCKETS = 96
+
+REPORTED_PERCENTILES = {"p50": 50, "p90": 90, "p99": 99, "p999": 99.9}
+
+
+def bucket_index(value):
+    if value <= HISTOGRAM_MIN:
+        return 0
+    index = math.ceil(math.log(value / HISTOGRAM_MIN, HISTOGRAM_GROWTH))
+    return min(index, HISTOGRAM_BUCKETS - 1)
+
+
+def bucket_bounds(index):
+    upper = HISTOGRAM_MIN * HISTOGRAM_GROWTH ** index
+    lower = 0.0 if index == 0 else upper / HISTOGRAM_GROWTH
+    return lower, upper
+
+
+def histogram_from_samples(samples):
+    buckets = {}
+    for sample in samples:
+        key = str(bucket_index(sample))
+        buckets[key] = buckets.get(key, 0) + 1
+    return buckets
+
+
+def histogram_percentiles(buckets, min_value=None, max_value=None):
+    """Estimate REPORTED_PERCENTILES from a {bucket index: count} histogram.
+
+    Each estimate is the geometric midpoint of the bucket holding the percentile,
+    clamped to the observed min/max when those are known.
+    """
+    counts = sorted((int(index), count) for index, count in buckets.items() if count)
+    total = sum(count for _, count in counts)
+    result = {}
+    for name, percentile in REPORTED_PERCENTILES.items():
+        if not total:
+            result[name] = 0.0
+            continue
+
+        rank = math.ceil(total * percentile / 100)
+        cumulative = 0
+        for index, count in counts:
+            cumulative += count
+            if cumulative >= rank:
+                break
+
+        lower, upper = bucket_bounds(index)
+        estimate = math.sqrt(lower * upper) if lower else upper
+        if min_value is not None:
+            estimate = max(estimate, min_value)
+        if max_value is not None:
+            estimate = min(estimate, max_value)
+        result[name] = estimate
+    return result
+
+
+def merge_route_metrics(data, other):
+    """Add the route metrics in `other` (hits, errors, total/min/max time, buckets) into `data`."""
+    data["hits"] += other["hits"]
+    data["errors"] += other["errors"]
+    data["total_time"] += other["total_time"]
+    data["min_time"] = min(data["min_time"], other["min_time"])
+    data["max_time"] = max(data["max_time"], other["max_time"])
+    for index, count in other["buckets"].items():
+        data["buckets"][index] = data["buckets"].get(index, 0) + count
+
+
+class MetricsBuffer:
+    """Aggregates route metrics in process so they can be written to storage in one update.
+
+    Storage per route is constant (counters plus at most HISTOGRAM_BUCKETS buckets), so the
+    buffer can absorb any number of requests between flushes.
+    """
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.flush_requested = asyncio.Event()
+        self._routes = {}
+        self._pending = 0
+
+    def record(self, route, elapsed_time, error_occurred):
+        data = self._routes.get(route)
+        if data is None:
+            data = self._routes[route] = {
+                "hits": 0,
+                "errors": 0,
+                "total_time": 0.0,
+                "min_time": elapsed_time,
+                "max_time": elapsed_time,
+                "buckets": {},
+            }
+        self._merge(data, {
+            "hits": 1,
+            "errors": int(error_occurred),
+            "total_time": elapsed_time,
+            "min_time": elapsed_time,
+            "max_time": elapsed_time,
+            "buckets": {str(bucket_index(elapsed_time)): 1},
+        })
+        self._pending += 1
+        if self._pending >= self.max_pending:
+            self.flush_requested.set()
+
+    def drain(self):
+        routes, self._routes = self._routes, {}
+        self._pending = 0
+        self.flush_requested.clear()
+        return routes
+
+    def restore(self, routes):
+        """Merge drained data back after a failed flush so it is retried with the next one."""
+        for route, data in routes.items():
+            if route in self._routes:
+                self._merge(self._routes[route], data)
+            else:
+                self._routes[route] = data
+            self._pending += data["hits"]
+
+    def pending(self):
+        return self._pending
+
+    @staticmethod
+    def _merge(data, other):
+        merge_route_metrics(data, other)
+
+
+class StageHistograms:
+    """In-process latency histograms for the stages of the request path (see tracing.py).
+
+    Kept per worker process and never persisted; each stage holds at most HISTOGRAM_BUCKETS counters.
+    """
+
+    def __init__(self):
+        self._stages = {}
+
+    def record(self, stage, elapsed_time):
+        data = self._stages.get(stage)
+        if data is None:
+            data = self._stages[stage] = {
+                "count": 0,
+                "total_time": 0.0,
+                "min_time": elapsed_time,
+                "max_time": elapsed_time,
+                "buckets": {},
+            }
+        data["count"] += 1
+        data["total_time"] += elapsed_time
+        if elapsed_time < data["min_time"]:
+            data["min_time"] = elapsed_time
+        if elapsed_time > data["max_time"]:
+            data["max_time"] = elapsed_time
+        index = bucket_index(elapsed_time)
+        data["buckets"][index] = data["buckets"].get(index, 0) + 1
+
+    def snapshot(self):
+        stages = {}
+        for stage, data in sorted(self._stages.items()):
+            percentiles = histogram_percentiles(data["buckets"], data["min_time"], data["max_time"])
+            stages[stage] = {
+                "count": data["count"],
+                "total_time": round(data["total_time"], 6),
+                "mean": round(data["total_time"] / data["count"], 6),
+                "min_time": round(data["min_time"], 6),
+                "max_time": round(data["max_time"], 6),
+                **{name: round(value, 6) for name, value in percentiles.items()},
+            }
+        return stages
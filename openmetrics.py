@@ -0,0 +1,288 @@
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Fixed latency buckets (upper bounds in seconds) for the exported histograms. Prometheus
+# aggregates histograms by bucket, so every process and route must use the same bounds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+BUCKET_LABELS = (*(str(bound) for bound in LATENCY_BUCKETS), "+Inf")
+
+METRICS = {
+    "weather_http_requests": ("counter", "HTTP requests handled, by route."),
+    "weather_http_request_errors": ("counter", "HTTP requests that failed, by route."),
+    "weather_http_request_duration_seconds": ("histogram", "HTTP request latency, by route."),
+    "weather_http_requests_in_flight": ("gauge", "HTTP requests currently being handled."),
+    "weather_cache_lookups": ("counter", "Cache lookups, by cache type, tier and result."),
+    "weather_upstream_requests": ("counter", "Open-Meteo request attempts, by API and status."),
+    "weather_upstream_request_duration_seconds": ("histogram", "Open-Meteo request latency, by API."),
+    "weather_upstream_requests_in_flight": ("gauge", "Open-Meteo requests currently in flight."),
+}
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsRegistry:
+    """In-memory counters, gauges and histograms for the OpenMetrics exposition.
+
+    Values are keyed by (metric name, sorted label pairs). Recording is a dict update,
+    and rendering never leaves the process, so a scrape never touches storage.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        histogram[0][bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[1] += value
+
+    def merged_with(self, snapshots):
+        """This registry's values summed with other processes' snapshots, ready for `render`."""
+        values, histograms = merge_snapshots(snapshots)
+        for key, value in self._values.items():
+            values[key] = values.get(key, 0) + value
+        for key, (counts, total) in self._histograms.items():
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [counts, total]
+            else:
+                histograms[key] = [[a + b for a, b in zip(merged[0], counts)], merged[1] + total]
+        return values, histograms
+
+    def snapshot(self):
+        """JSON-serializable copy of every value, as written to per-process snapshot files."""
+        return {
+            "values": [[name, labels, value] for (name, labels), value in self._values.items()],
+            "histograms": [
+                [name, labels, list(counts), total]
+                for (name, labels), (counts, total) in self._histograms.items()
+            ],
+        }
+
+
+def merge_snapshots(snapshots):
+    """Sum counters, gauges and histogram buckets of several snapshots, label set by label set."""
+    values = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["values"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, counts, total in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(counts), total]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+    return values, histograms
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(values, histograms, openmetrics=True):
+    """Render merged values as OpenMetrics text, or as Prometheus text format 0.0.4."""
+    series = {name: [] for name in METRICS}
+    for (name, labels), value in values.items():
+        series[name].append((labels, value))
+    for (name, labels), histogram in histograms.items():
+        series[name].append((labels, histogram))
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        # OpenMetrics names the counter family without `_total`; the Prometheus text format includes it.
+        family = name if openmetrics or metric_type != "counter" else f"{name}_total"
+        lines.append(f"# TYPE {family} {metric_type}")
+        lines.append(f"# HELP {family} {help_text}")
+        if metric_type == "histogram":
+            for labels, (counts, total) in sorted(series[name]):
+                label_text = format_labels(labels)
+                bucket_prefix = f"{name}_bucket{label_text[:-1]}," if labels else f"{name}_bucket{{"
+                cumulative = 0
+                for bound, count in zip(BUCKET_LABELS, counts):
+                    cumulative += count
+                    lines.append(f'{bucket_prefix}le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_count{label_text} {cumulative}")
+                lines.append(f"{name}_sum{label_text} {format_value(total)}")
+        else:
+            suffix = "_total" if metric_type == "counter" else ""
+            for labels, value in sorted(series[name]):
+                lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+# Counters and histograms of exited workers, summed, so the totals never go down when a worker exits.
+ACCUMULATED_FILE = "accumulated.json"
+
+
+def snapshot_path(directory, pid=None):
+    return os.path.join(directory, f"{os.getpid() if pid is None else pid}.json")
+
+
+def write_snapshot(directory, snapshot, path=None):
+    """Atomically replace this process' snapshot file so other workers never read a partial one."""
+    path = path or snapshot_path(directory)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(snapshot, file)
+    os.replace(temp_path, path)
+
+
+def without_gauges(snapshot):
+    snapshot["values"] = [value for value in snapshot["values"] if METRICS.get(value[0], ("",))[0] != "gauge"]
+    return snapshot
+
+
+def load_snapshot(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def accumulate_snapshots(directory, paths):
+    """Fold the snapshots of exited workers into the accumulated file and delete them.
+
+    Gauges are dropped: a worker that is gone has nothing in flight.
+    """
+    accumulated_path = os.path.join(directory, ACCUMULATED_FILE)
+    try:
+        snapshots = [load_snapshot(accumulated_path)]
+    except FileNotFoundError:
+        snapshots = []
+    for path in paths:
+        try:
+            snapshots.append(without_gauges(load_snapshot(path)))
+        except (OSError, ValueError) as e:
+            logging.warning("Dropping unreadable metrics snapshot %s: %s", path, e)
+    values, histograms = merge_snapshots(snapshots)
+    write_snapshot(directory, {
+        "values": [[name, labels, value] for (name, labels), value in values.items()],
+        "histograms": [[name, labels, counts, total] for (name, labels), (counts, total) in histograms.items()],
+    }, accumulated_path)
+    for path in paths:
+        os.remove(path)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def snapshots_locked(directory):
+    """Hold an exclusive lock on the snapshot directory (where fcntl is available)."""
+    with open(os.path.join(directory, "accumulated.lock"), "a") as lock:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def retire_snapshot(directory, pid=None):
+    """Fold a snapshot left under this pid by an earlier process into the accumulated file, so a
+    reused pid doesn't overwrite it with smaller counts."""
+    path = snapshot_path(directory, pid)
+    with snapshots_locked(directory):
+        if os.path.exists(path):
+            accumulate_snapshots(directory, [path])
+
+
+def read_snapshots(directory, exclude_pid=None, stale_after=None, max_age=None):
+    """Read the accumulated file and the snapshot files of every worker process except `exclude_pid`.
+
+    Files of processes that are gone, or not updated for `max_age` seconds, are folded into the
+    accumulated file, like prometheus_client's multiprocess mode, so their counters and histograms
+    keep counting. Snapshots older than `stale_after` seconds lose their gauges, which would otherwise
+    stay stuck at the last value a hung worker reported.
+
+    The directory is locked while it is read, so that two workers scraping at once never fold the
+    same file twice, nor see it in neither place. This is blocking disk I/O; call it off the event loop.
+    """
+    with snapshots_locked(directory):
+        return _read_snapshots(directory, exclude_pid, stale_after, max_age)
+
+
+def _read_snapshots(directory, exclude_pid, stale_after, max_age):
+    live = []
+    exited = []
+    now = time.time()
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+        except ValueError:
+            continue
+        if pid == exclude_pid:
+            continue
+        try:
+            age = now - os.path.getmtime(path)
+        except OSError:
+            continue
+        if not process_alive(pid) or (max_age is not None and age > max_age):
+            exited.append(path)
+        else:
+            live.append((path, age))
+    if exited:
+        accumulate_snapshots(directory, exited)
+
+    snapshots = []
+    try:
+        snapshots.append(load_snapshot(os.path.join(directory, ACCUMULATED_FILE)))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning("Skipping unreadable accumulated metrics %s: %s", directory, e)
+    for path, age in live:
+        try:
+            snapshot = load_snapshot(path)
+        except (OSError, ValueError) as e:
+            logging.warning("Skipping unreadable metrics snapshot %s: %s", path, e)
+            continue
+        snapshots.append(without_gauges(snapshot) if stale_after is not None and age > stale_after else snapshot)
+    return snapshots
+
+
+def remove_snapshots(directory):
+    """Delete every snapshot, the accumulated totals of exited workers included."""
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+
+registry = MetricsRegistry()
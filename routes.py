@@ -1,12 +1,71 @@
 import logging
 import time
-from flask import request, jsonify
-from utils import WeatherAppException
-from config import app
+from quart import Blueprint, Response, request, jsonify, g
+from utils import WeatherAppException, normalize_city
+from config import SERVER_TIMING
+from health import startup_timings
+from tracing import start_request_timings, server_timing_header, request_profiler
+from httpcache import response_cache, query_key, text, float_list
+from openmetrics import registry
 import services 
 from services import track_metrics 
+from upstream import upstream_client
+from storage import storage
 
-@app.route("/weather/monthly-profile", methods=["GET"])
+bp = Blueprint("weather", __name__)
+
+# Startup only schedules background work; nothing here waits on MongoDB or Open-Meteo.
+bp.before_app_serving(services.start_storage_setup)
+bp.before_app_serving(services.start_metrics_flusher)
+bp.before_app_serving(services.start_metrics_snapshots)
+bp.before_app_serving(services.start_profile_index_builder)
+bp.before_app_serving(services.start_warmup)
+bp.after_app_serving(services.stop_warmup)
+bp.after_app_serving(services.stop_profile_index_builder)
+bp.after_app_serving(services.stop_storage_setup)
+bp.after_app_serving(services.stop_metrics_flusher)
+bp.after_app_serving(services.stop_metrics_snapshots)
+bp.after_app_serving(upstream_client.aclose)
+bp.after_app_serving(storage.close)
+
+@bp.before_app_serving
+async def mark_serving():
+    startup_timings.mark("serving")
+
+@bp.before_app_request
+async def start_request_tracing():
+    registry.inc("weather_http_requests_in_flight")
+    g.request_start = time.perf_counter()
+    start_request_timings()
+    g.profiler = request_profiler.maybe_start()
+
+@bp.after_app_request
+async def finish_request_tracing(response):
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing_header(time.perf_counter() - g.request_start)
+    return response
+
+@bp.teardown_app_request
+async def end_request_tracing(exception):
+    # Teardown also runs when the handler is cancelled by a client disconnect, unlike after_request,
+    # so the profiler can't be left enabled on the event loop thread.
+    registry.inc("weather_http_requests_in_flight", -1)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        await request_profiler.stop(profiler, request.path)
+
+def cached_json(cached):
+    """Send a cached response with its ETag, or an empty 304 if the client's If-None-Match already has it."""
+    body, etag = cached
+    if request.if_none_match.contains_weak(etag):
+        response = Response(b"", 304, content_type="application/json")
+    else:
+        response = Response(body, 200, content_type="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = response_cache.cache_control
+    return response
+
+@bp.route("/weather/monthly-profile", methods=["GET"])
 async def monthly_weather_profile():
     route = "/weather/monthly-profile"
     start_time = time.perf_counter()
@@ -15,19 +74,74 @@ async def monthly_weather_profile():
     try:
         city = request.args.get("city")
         month = request.args.get("month")
+        key = query_key(route, request.args, city=text, month=int)
+
+        cached = response_cache.get(key)
+        if cached is None:
+            response = await services.monthly_weather_profile_service(city, month)
+            logging.info("Monthly profile for city: %s, month: %s computed successfully.", city, month)
+            cached = response_cache.put(key, response)
+        else:
+            services.record_city_hits([normalize_city(city)])
+        return cached_json(cached)
+    except Exception as e:
+        error_occurred = True
+        logging.exception("Error in monthly_weather_profile: %s", e)
+        return jsonify({"error": str(e)}), 400
+    finally:
+        elapsed_time = time.perf_counter() - start_time
+        track_metrics(route, elapsed_time, error_occurred)
 
-        response = await services.monthly_weather_profile_service(city, month)
-        logging.info(f"Monthly profile for city: {city}, month: {month} computed successfully.")
+@bp.route("/weather/monthly-profiles", methods=["POST"])
+async def batch_monthly_weather_profile():
+    route = "/weather/monthly-profiles"
+    start_time = time.perf_counter()
+    error_occurred = False
+
+    try:
+        body = await request.get_json(silent=True) or {}
+        items = body.get("items") if isinstance(body, dict) else None
+
+        response = await services.batch_monthly_profile_service(items)
+        logging.info("Batch monthly profile for %s items computed successfully.", len(items))
         return jsonify(response)
     except Exception as e:
         error_occurred = True
-        logging.exception(f"Error in monthly_weather_profile: {e}")
+        logging.exception("Error in batch_monthly_weather_profile: %s", e)
+        return jsonify({"error": str(e)}), 400
+    finally:
+        elapsed_time = time.perf_counter() - start_time
+        track_metrics(route, elapsed_time, error_occurred)
+
+@bp.route("/weather/monthly-stats", methods=["GET"])
+async def monthly_weather_stats():
+    route = "/weather/monthly-stats"
+    start_time = time.perf_counter()
+    error_occurred = False
+
+    try:
+        city = request.args.get("city")
+        month = request.args.get("month")
+        percentiles = request.args.get("percentiles")
+        key = query_key(route, request.args, city=text, month=int, percentiles=float_list)
+
+        cached = response_cache.get(key)
+        if cached is None:
+            response = await services.monthly_statistics_service(city, month, percentiles)
+            logging.info("Monthly statistics for city: %s, month: %s computed successfully.", city, month)
+            cached = response_cache.put(key, response)
+        else:
+            services.record_city_hits([normalize_city(city)])
+        return cached_json(cached)
+    except Exception as e:
+        error_occurred = True
+        logging.exception("Error in monthly_weather_stats: %s", e)
         return jsonify({"error": str(e)}), 400
     finally:
         elapsed_time = time.perf_counter() - start_time
-        await track_metrics(route, elapsed_time, error_occurred)
+        track_metrics(route, elapsed_time, error_occurred)
 
-@app.route("/travel/best-month", methods=["GET"])
+@bp.route("/travel/best-month", methods=["GET"])
 async def best_travel_month():
     route = "/travel/best-month"
     start_time = time.perf_counter()
@@ -37,19 +151,25 @@ async def best_travel_month():
         city = request.args.get("city")
         min_temp = request.args.get("min_temp")
         max_temp = request.args.get("max_temp")
+        key = query_key(route, request.args, city=text, min_temp=float, max_temp=float)
 
-        response = await services.best_travel_month_service(city, min_temp, max_temp)
-        logging.info(f"Best travel month for city: {city} is month: {response['best_month']}")
-        return jsonify(response)
+        cached = response_cache.get(key)
+        if cached is None:
+            response = await services.best_travel_month_service(city, min_temp, max_temp)
+            logging.info("Best travel month for city: %s is month: %s", city, response['best_month'])
+            cached = response_cache.put(key, response)
+        else:
+            services.record_city_hits([normalize_city(city)])
+        return cached_json(cached)
     except Exception as e:
         error_occurred = True
-        logging.exception(f"Error in best_travel_month: {e}")
+        logging.exception("Error in best_travel_month: %s", e)
         return jsonify({"error": str(e)}), 400
     finally:
         elapsed_time = time.perf_counter() - start_time
-        await track_metrics(route, elapsed_time, error_occurred)
+        track_metrics(route, elapsed_time, error_occurred)
 
-@app.route("/travel/compare-cities", methods=["GET"])
+@bp.route("/travel/compare-cities", methods=["GET"])
 async def compare_cities():
     route = "/travel/compare-cities"
     start_time = time.perf_counter()
@@ -60,22 +180,63 @@ async def compare_cities():
         month = request.args.get("month")
 
         response = await services.compare_cities_service(cities, month)
-        logging.info(f"City comparison for month: {month} completed successfully.")
+        logging.info("City comparison for month: %s completed successfully.", month)
+        return jsonify(response)
+    except Exception as e:
+        error_occurred = True
+        logging.exception("Error in compare_cities: %s", e)
+        return jsonify({"error": str(e)}), 400
+    finally:
+        elapsed_time = time.perf_counter() - start_time
+        track_metrics(route, elapsed_time, error_occurred)
+
+@bp.route("/travel/search", methods=["GET"])
+async def search_cities():
+    route = "/travel/search"
+    start_time = time.perf_counter()
+    error_occurred = False
+
+    try:
+        month = request.args.get("month")
+        min_temp = request.args.get("min_temp")
+        max_temp = request.args.get("max_temp")
+        limit = request.args.get("limit")
+
+        response = await services.search_cities_service(month, min_temp, max_temp, limit)
+        logging.info("City search for month: %s returned %s cities.", month, len(response['results']))
         return jsonify(response)
     except Exception as e:
         error_occurred = True
-        logging.exception(f"Error in compare_cities: {e}")
+        logging.exception("Error in search_cities: %s", e)
         return jsonify({"error": str(e)}), 400
     finally:
         elapsed_time = time.perf_counter() - start_time
-        await track_metrics(route, elapsed_time, error_occurred)
+        track_metrics(route, elapsed_time, error_occurred)
 
-@app.route("/metrics", methods=["GET"])
+@bp.route("/metrics", methods=["GET"])
 async def get_metrics():
     try:
+        exposition_format = services.metrics_format(request.headers.get("Accept", ""), request.args.get("format"))
+        if exposition_format != "json":
+            body, content_type = await services.metrics_exposition(exposition_format == "openmetrics")
+            return body, 200, {"Content-Type": content_type}
+
         response = await services.retrieve_metrics()
         logging.info("Metrics retrieved successfully.")
         return jsonify(response)
     except Exception as e:
-        logging.exception(f"Error in get_metrics: {e}")
+        logging.exception("Error in get_metrics: %s", e)
         return jsonify({"error": str(e)}), 500
+
+@bp.route("/healthz", methods=["GET"])
+async def healthz():
+    return jsonify(services.health_status())
+
+@bp.route("/readyz", methods=["GET"])
+async def readyz():
+    try:
+        ready, response = await services.readiness_status()
+        return jsonify(response), 200 if ready else 503
+    except Exception as e:
+        logging.exception("Error in readyz: %s", e)
+        return jsonify({"status": "not ready", "error": str(e)}), 503
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class ProfileIndex:
+    """Dense in-memory index of the monthly temperature profiles of every known city.
+
+    Profiles live in two (12, capacity) float32 arrays, one row per month and one column
+    per location, so ranking all cities for a month is a couple of vectorized operations
+    over contiguous memory. Months without data are NaN and never match. Aliases of a city
+    resolve to the same location and share its column, reported under the latest name.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self._cities = []
+        self._columns = {}
+        self._min_avgs = np.full((12, initial_capacity), np.nan, dtype=np.float32)
+        self._max_avgs = np.full((12, initial_capacity), np.nan, dtype=np.float32)
+
+    def __len__(self):
+        return len(self._cities)
+
+    def update(self, location, city, month, min_temp_avg, max_temp_avg):
+        column = self._columns.get(location)
+        if column is None:
+            column = len(self._cities)
+            if column == self._min_avgs.shape[1]:
+                self._grow()
+            self._cities.append(city)
+            self._columns[location] = column
+        else:
+            self._cities[column] = city
+        self._min_avgs[month - 1, column] = min_temp_avg
+        self._max_avgs[month - 1, column] = max_temp_avg
+
+    def search(self, month, min_temp, max_temp, limit):
+        """Return up to `limit` (city, min_avg, max_avg, min_diff, max_diff, overall_diff), best first.
+
+        Cities are scored like best_travel_month_service scores months:
+        abs(min_temp - min_avg) + abs(max_temp - max_avg).
+        """
+        count = len(self._cities)
+        min_avgs = self._min_avgs[month - 1, :count]
+        max_avgs = self._max_avgs[month - 1, :count]
+        min_diffs = np.abs(min_avgs - np.float32(min_temp))
+        max_diffs = np.abs(max_avgs - np.float32(max_temp))
+        scores = min_diffs + max_diffs
+
+        candidates = np.flatnonzero(~np.isnan(scores))
+        if candidates.size > limit:
+            candidates = candidates[np.argpartition(scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(scores[candidates], kind="stable")]
+
+        return [
+            (
+                self._cities[column],
+                float(min_avgs[column]),
+                float(max_avgs[column]),
+                float(min_diffs[column]),
+                float(max_diffs[column]),
+                float(scores[column]),
+            )
+            for column in candidates
+        ]
+
+    def _grow(self):
+        capacity = self._min_avgs.shape[1] * 2
+        for name in ("_min_avgs", "_max_avgs"):
+            grown = np.full((12, capacity), np.nan, dtype=np.float32)
+            grown[:, :len(self._cities)] = getattr(self, name)[:, :len(self._cities)]
+            setattr(self, name, grown)
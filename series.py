@@ -0,0 +1,72 @@
+import numpy as np
+
+# Daily series are stored as packed little-endian float32 arrays (missing days as NaN),
+# one value per day from `start_date`, so dates never need to be stored.
+SERIES_FIELDS = ("temperature_2m_min", "temperature_2m_max")
+SERIES_DTYPE = np.dtype("<f4")
+
+
+def location_key(lat, lon):
+    return f"{lat:.4f},{lon:.4f}"
+
+
+def shift_date(date, days):
+    return str(np.datetime64(date, "D") + days)
+
+
+def series_dates(start_date, days):
+    return np.datetime64(start_date, "D") + np.arange(days)
+
+
+def series_from_archive(daily, start_date, end_date):
+    """Return {field: float32 array} with one value per day in [start_date, end_date].
+
+    Values are placed by date, so days the archive didn't return are NaN like missing ones.
+    """
+    days = int((np.datetime64(end_date, "D") - np.datetime64(start_date, "D")).astype(np.int64)) + 1
+    offsets = (np.array(daily["time"], dtype="datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64)
+    in_range = (offsets >= 0) & (offsets < days)
+    series = {}
+    for field in SERIES_FIELDS:
+        values = np.full(days, np.nan, dtype=SERIES_DTYPE)
+        values[offsets[in_range]] = np.array(daily[field], dtype=np.float64)[in_range]
+        series[field] = values
+    return series
+
+
+def series_document(lat, lon, start_date, series):
+    """Build the compact storage document for daily series starting at `start_date`."""
+    packed = {field: series[field].astype(SERIES_DTYPE).tobytes() for field in SERIES_FIELDS}
+    days = len(series[SERIES_FIELDS[0]])
+    return {
+        "_id": location_key(lat, lon),
+        "lat": lat,
+        "lon": lon,
+        "start_date": start_date,
+        "end_date": shift_date(start_date, days - 1),
+        "days": days,
+        "nbytes": sum(len(data) for data in packed.values()),
+        **packed,
+    }
+
+
+def series_from_document(doc):
+    """Return (dates, {field: float32 array}) from a stored series document."""
+    dates = series_dates(doc["start_date"], doc["days"])
+    return dates, {field: np.frombuffer(doc[field], dtype=SERIES_DTYPE) for field in SERIES_FIELDS}
+
+
+def extend_series(series, before=None, after=None):
+    """Concatenate series blocks that directly precede/follow `series`."""
+    return {
+        field: np.concatenate([
+            block[field] for block in (before, series, after) if block is not None
+        ])
+        for field in SERIES_FIELDS
+    }
+
+
+def select_series(dates, series, start_date, end_date):
+    """Return (dates, series) restricted to days within [start_date, end_date]."""
+    mask = (dates >= np.datetime64(start_date, "D")) & (dates <= np.datetime64(end_date, "D"))
+    return dates[mask], {field: values[mask] for field, values in series.items()}
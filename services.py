@@ -1,197 +1,1016 @@
+import asyncio
 import logging
-import statistics
-import httpx
-from utils import WeatherAppException
+import os
+import socket
+import time
+import numpy as np
+from collections import defaultdict, Counter
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from utils import WeatherAppException, CityNotFoundException, SingleFlight, gather_bounded, normalize_city, split_country_code
+from upstream import upstream_client
+from storage import storage
+from search import ProfileIndex
+from cache import l1_cache
+from httpcache import response_cache
+from aggregation import monthly_totals, add_totals, profiles_from_totals, monthly_statistics
+from series import (
+    SERIES_FIELDS,
+    location_key,
+    shift_date,
+    series_from_archive,
+    series_document,
+    series_from_document,
+    extend_series,
+    select_series
+)
+from metrics import MetricsBuffer, histogram_percentiles
+from tracing import Span, stage_histograms
+from health import CachedCheck, startup_timings
+from openmetrics import (
+    registry,
+    render,
+    write_snapshot,
+    read_snapshots,
+    retire_snapshot,
+    OPENMETRICS_CONTENT_TYPE,
+    PROMETHEUS_CONTENT_TYPE
+)
 from config import (
-    cache_collection,
-    metrics_collection,
-    metrics_objectID,
     START_DATE,
-    END_DATE
+    END_DATE,
+    GEOCODING_API_URL,
+    ARCHIVE_API_URL,
+    L1_NEGATIVE_CACHE_TTL,
+    GEOCODE_FRESH_TTL,
+    GEOCODE_EXPIRE_TTL,
+    WEATHER_FRESH_TTL,
+    WEATHER_EXPIRE_TTL,
+    ARCHIVE_REVISION_DAYS,
+    METRICS_FLUSH_INTERVAL,
+    METRICS_FLUSH_MAX_PENDING,
+    METRICS_DIR,
+    METRICS_SNAPSHOT_INTERVAL,
+    METRICS_SNAPSHOT_MAX_AGE,
+    FANOUT_LIMIT,
+    FANOUT_ITEM_TIMEOUT,
+    BATCH_MAX_ITEMS,
+    SEARCH_MAX_RESULTS,
+    WARMUP_CITIES,
+    WARMUP_TOP_CITIES,
+    WARMUP_INTERVAL,
+    WARMUP_LEASE_TTL,
+    STARTUP_RETRY_MAX,
+    PROFILE_INDEX_RELOAD_INTERVAL,
+    HEALTH_CHECK_TTL,
+    HEALTH_CHECK_TIMEOUT,
+    UPSTREAM_CHECK_TTL,
+    READY_REQUIRE_WARMUP,
+    READY_REQUIRE_UPSTREAM
 )
 
+CACHE_TTLS = {
+    "geocode": (GEOCODE_FRESH_TTL, GEOCODE_EXPIRE_TTL),
+    "weather": (WEATHER_FRESH_TTL, WEATHER_EXPIRE_TTL),
+}
+
+in_flight = SingleFlight()
+metrics_buffer = MetricsBuffer(METRICS_FLUSH_MAX_PENDING)
+metrics_flush_task = None
+metrics_snapshot_task = None
+profile_index = ProfileIndex()
+profile_index_task = None
+profile_index_reload_task = None
+# When the last load of the search index from storage started, None until the first one succeeds.
+profile_index_loaded_at = None
+city_hits = Counter()
+warmup_task = None
+warmup_progress = {"state": "idle", "total": 0, "completed": 0, "skipped": 0, "failed": 0, "current": None}
+storage_setup_task = None
+
+async def ping_storage():
+    await storage.ping()
+
+async def ping_upstream():
+    await upstream_client.ping(GEOCODING_API_URL, params={"name": "Berlin", "count": 1})
+
+storage_check = CachedCheck(ping_storage, HEALTH_CHECK_TTL, HEALTH_CHECK_TIMEOUT)
+upstream_check = CachedCheck(
+    ping_upstream, UPSTREAM_CHECK_TTL, HEALTH_CHECK_TIMEOUT, observed=upstream_client.last_outcome
+)
+
+async def retry_with_backoff(description, func, *args):
+    """Await `func(*args)` until it succeeds, retrying after 1, 2, 4... seconds, up to STARTUP_RETRY_MAX."""
+    delay = 1
+    while True:
+        try:
+            return await func(*args)
+        except Exception as e:
+            logging.exception("Couldn't %s, retrying in %ss - %s", description, delay, e)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, STARTUP_RETRY_MAX)
+
+async def prepare_storage():
+    """Create indexes and run migrations in the background, so the server listens right away.
+
+    Each step is retried until storage answers, so a worker started while the database is down
+    still gets its indexes and migrations, and isn't reported ready before.
+    """
+    await retry_with_backoff("create cache indexes in storage", ensure_indexes)
+    await retry_with_backoff("migrate metrics", storage.migrate_metrics)
+    startup_timings.mark("storage_ready")
+
+async def start_storage_setup():
+    global storage_setup_task
+    storage_setup_task = asyncio.create_task(prepare_storage())
+
+async def stop_storage_setup():
+    if storage_setup_task is not None and not storage_setup_task.done():
+        storage_setup_task.cancel()
+        try:
+            await storage_setup_task
+        except asyncio.CancelledError:
+            pass
+
+async def ensure_indexes():
+    await storage.ensure_indexes()
+    await backfill_cache_expiry()
+    logging.info("Cache indexes ensured (%s storage).", storage.name)
+
+async def backfill_cache_expiry():
+    """Give entries cached before expiry existed an expiry date, and mark them stale so they get refreshed."""
+    for cache_type in CACHE_TTLS:
+        modified = await storage.backfill_expiry(cache_type, {**cache_expiry(cache_type), "fresh_until": 0})
+        if modified:
+            logging.info("Added expiry to %s %s cache entries.", modified, cache_type)
+
+def cache_expiry(cache_type):
+    fresh_ttl, expire_ttl = CACHE_TTLS[cache_type]
+    return {
+        "fresh_until": time.time() + fresh_ttl,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=expire_ttl),
+    }
+
+def is_stale(cached_doc):
+    return cached_doc.get("fresh_until", 0) <= time.time()
+
+def revalidate(key, func, *args):
+    """Refresh a stale cache entry in the background, at most once at a time per key."""
+    async def refresh():
+        try:
+            return await func(*args)
+        except Exception as e:
+            logging.warning("Background refresh of %s failed - %s", key, e)
+            raise
+
+    if in_flight.start(key, refresh):
+        logging.info("Refreshing stale cache entry %s in the background.", key)
+
 async def check_cache(cache_type, city, month=None):
+    cached = l1_cache.get((cache_type, city, month))
+    if cached is not None:
+        registry.inc("weather_cache_lookups", cache_type=cache_type, tier="l1", result="hit")
+        return cached
+    registry.inc("weather_cache_lookups", cache_type=cache_type, tier="l1", result="miss")
+
     try:
-        filter_query = {"cache_type": cache_type, "city": city}
-        if month is not None:
-            filter_query["month"] = month
-        result = await cache_collection.find_one(filter_query)
+        with Span("storage_read"):
+            result = await storage.find_cache(cache_type, city, month)
+        registry.inc("weather_cache_lookups", cache_type=cache_type, tier="storage", result="hit" if result else "miss")
         if not result:
             return False
+        if cache_type == "weather":
+            remember_weather(result)
+        else:
+            l1_cache.set((cache_type, city, month), result)
         return result
     except Exception as e:
-        logging.exception(f"Couldn't get cache from mongodb - {str(e)}")
+        logging.exception("Couldn't get cache from storage - %s", e)
+
+async def check_cache_months(location):
+    cached_months = {}
+    for month in range(1, 13):
+        cached = l1_cache.get(("weather", location, month))
+        if cached is None:
+            break
+        cached_months[month] = cached
+    else:
+        registry.inc("weather_cache_lookups", cache_type="weather", tier="l1", result="hit")
+        return cached_months
+    registry.inc("weather_cache_lookups", cache_type="weather", tier="l1", result="miss")
 
-async def track_metrics(route, elapsed_time, error_occurred):
     try:
-        filter_query = {"_id": metrics_objectID}
-        update_query = {
-            "$inc": {
-                f"{route}.hits": 1,
-                f"{route}.errors": int(error_occurred),
-            },
-            "$min": {f"{route}.min_time": elapsed_time},
-            "$max": {f"{route}.max_time": elapsed_time},
-            "$push": {f"{route}.times": elapsed_time},
-            "$setOnInsert": {f"{route}.route_name": route}
-        }
+        with Span("storage_read"):
+            docs = await storage.find_weather(location)
+        cached_months = {}
+        for doc in docs:
+            remember_weather(doc)
+            cached_months[doc["month"]] = doc
+        registry.inc("weather_cache_lookups", cache_type="weather", tier="storage", result="hit" if cached_months else "miss")
+        return cached_months
+    except Exception as e:
+        logging.exception("Couldn't get cache from storage - %s", e)
+        return {}
 
-        await metrics_collection.update_one(
-            filter_query,
-            update_query,
-            upsert=True
+async def check_cache_many(location_months):
+    """Look up many (location, month) weather entries: in-process first, then one storage query."""
+    found = {}
+    missing = defaultdict(set)
+    for location, month in location_months:
+        cached = l1_cache.get(("weather", location, month))
+        if cached is not None:
+            found[(location, month)] = cached
+        else:
+            missing[location].add(month)
+    misses = sum(len(months) for months in missing.values())
+    registry.inc("weather_cache_lookups", len(found), cache_type="weather", tier="l1", result="hit")
+    registry.inc("weather_cache_lookups", misses, cache_type="weather", tier="l1", result="miss")
+
+    if not missing:
+        return found
+
+    try:
+        with Span("storage_read"):
+            docs = await storage.find_weather_many(missing)
+        for doc in docs:
+            remember_weather(doc)
+            found[(doc["city"], doc["month"])] = doc
+        hits = len(found) - (len(location_months) - misses)
+        registry.inc("weather_cache_lookups", hits, cache_type="weather", tier="storage", result="hit")
+        registry.inc("weather_cache_lookups", misses - hits, cache_type="weather", tier="storage", result="miss")
+    except Exception as e:
+        logging.exception("Couldn't get cache from storage - %s", e)
+    return found
+
+def track_metrics(route, elapsed_time, error_occurred):
+    with Span("track_metrics"):
+        metrics_buffer.record(route, elapsed_time, error_occurred)
+        registry.inc("weather_http_requests", route=route)
+        if error_occurred:
+            registry.inc("weather_http_request_errors", route=route)
+        registry.observe("weather_http_request_duration_seconds", elapsed_time, route=route)
+        logging.info("Route %s processed in %.2f seconds", route, elapsed_time)
+
+def record_city_hits(cities):
+    city_hits.update(cities)
+
+async def flush_city_hits():
+    global city_hits
+    hits, city_hits = city_hits, Counter()
+    if not hits:
+        return
+
+    try:
+        await storage.add_city_hits(hits)
+    except Exception as e:
+        city_hits.update(hits)
+        logging.exception("Failed to flush hits for %s cities: %s", len(hits), e)
+
+async def flush_metrics():
+    await flush_city_hits()
+    routes = metrics_buffer.drain()
+    if not routes:
+        return
+
+    try:
+        await storage.add_route_metrics(routes)
+        logging.debug("Flushed metrics for routes: %s", list(routes))
+    except Exception as e:
+        metrics_buffer.restore(routes)
+        logging.exception("Failed to flush metrics, %s samples pending: %s", metrics_buffer.pending(), e)
+
+async def metrics_flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(metrics_buffer.flush_requested.wait(), METRICS_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        await flush_metrics()
+
+async def start_metrics_flusher():
+    global metrics_flush_task
+    metrics_flush_task = asyncio.create_task(metrics_flush_loop())
+
+async def stop_metrics_flusher():
+    if metrics_flush_task is not None:
+        metrics_flush_task.cancel()
+        try:
+            await metrics_flush_task
+        except asyncio.CancelledError:
+            pass
+    await flush_metrics()
+
+def metrics_format(accept, requested_format=None):
+    """Pick "openmetrics", "prometheus" or "json" from a `format` query parameter or the Accept header."""
+    if requested_format in ("openmetrics", "prometheus", "json"):
+        return requested_format
+    if "application/openmetrics-text" in accept:
+        return "openmetrics"
+    if "text/plain" in accept:
+        return "prometheus"
+    return "json"
+
+async def metrics_exposition(openmetrics=True):
+    """Render the in-memory metrics of this worker, plus the latest snapshots of the others and the
+    accumulated totals of exited workers, as text.
+
+    Snapshots are always read, since workers may be started by `uvicorn --workers` rather than
+    WEB_CONCURRENCY. Gauges are ignored in snapshots not updated for three intervals. The files are
+    read in a worker thread, off the event loop.
+    """
+    snapshots = await asyncio.get_running_loop().run_in_executor(
+        None,
+        partial(
+            read_snapshots,
+            METRICS_DIR,
+            exclude_pid=os.getpid(),
+            stale_after=3 * METRICS_SNAPSHOT_INTERVAL,
+            max_age=METRICS_SNAPSHOT_MAX_AGE
         )
-        logging.info(f"Route {route} processed in {elapsed_time:.2f} seconds")
+    )
+    body = render(*registry.merged_with(snapshots), openmetrics=openmetrics)
+    return body, OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+
+async def save_metrics_snapshot():
+    """Copy the registry on the event loop, so the snapshot is consistent, and write it from a worker thread."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, write_snapshot, METRICS_DIR, registry.snapshot())
     except Exception as e:
-        logging.exception(f"Failed to track metrics for route {route}: {e}")
+        logging.exception("Couldn't write metrics snapshot - %s", e)
+
+async def metrics_snapshot_loop():
+    while True:
+        await asyncio.sleep(METRICS_SNAPSHOT_INTERVAL)
+        await save_metrics_snapshot()
 
-async def get_lat_lon(city):
+async def start_metrics_snapshots():
+    global metrics_snapshot_task
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, retire_snapshot, METRICS_DIR)
+    except Exception as e:
+        logging.exception("Couldn't retire an earlier metrics snapshot - %s", e)
+    metrics_snapshot_task = asyncio.create_task(metrics_snapshot_loop())
+
+async def stop_metrics_snapshots():
+    if metrics_snapshot_task is not None:
+        metrics_snapshot_task.cancel()
+        try:
+            await metrics_snapshot_task
+        except asyncio.CancelledError:
+            pass
+        await save_metrics_snapshot()
+
+async def get_lat_lon(city, name=None):
+    """Coordinates of a normalized city name; `name` is the display name for a "not found" error."""
     cache_temp = await check_cache("geocode", city)
     if cache_temp:
-        logging.debug(f"Geocode cache hit for city: {city}")
+        if cache_temp.get("not_found"):
+            raise CityNotFoundException(name or city)
+        logging.debug("Geocode cache hit for city: %s", city)
+        if is_stale(cache_temp):
+            revalidate(("geocode", city), fetch_lat_lon, city)
         return (cache_temp["lat"], cache_temp["lon"])
 
-    logging.info(f"Fetching geocode data for city: {city}")
-    url = f"https://geocoding-api.open-meteo.com/v1/search?name={city}"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
+    try:
+        return await in_flight.do(("geocode", city), fetch_lat_lon, city)
+    except CityNotFoundException:
+        # The fetch is shared by every alias of the key; name the city as this caller typed it.
+        raise CityNotFoundException(name or city) from None
+
+async def get_location(city, name=None):
+    """Resolve a normalized city name to (location key, lat, lon). Aliases of a city share the location key."""
+    lat, lon = await get_lat_lon(city, name)
+    return location_key(lat, lon), lat, lon
+
+async def get_locations(cities, names=None):
+    """Resolve many normalized city names: {city: (location key, lat, lon), or the exception raised}.
+
+    Each distinct name is resolved once: from the in-process cache, then with one storage query,
+    and the rest are geocoded concurrently through the shared in-flight fetch. `names` maps
+    normalized names to display names for "not found" errors.
+    """
+    names = names or {}
+    cities = list(dict.fromkeys(cities))
+    geocodes = {}
+    missing = []
+    for city in cities:
+        cached = l1_cache.get(("geocode", city, None))
+        if cached is not None:
+            geocodes[city] = cached
+        else:
+            missing.append(city)
+    registry.inc("weather_cache_lookups", len(geocodes), cache_type="geocode", tier="l1", result="hit")
+    registry.inc("weather_cache_lookups", len(missing), cache_type="geocode", tier="l1", result="miss")
+
+    if missing:
+        try:
+            with Span("storage_read"):
+                docs = await storage.find_geocodes(missing)
+            for doc in docs:
+                l1_cache.set(("geocode", doc["city"], None), doc)
+                geocodes[doc["city"]] = doc
+            registry.inc("weather_cache_lookups", len(docs), cache_type="geocode", tier="storage", result="hit")
+            registry.inc(
+                "weather_cache_lookups", len(missing) - len(docs), cache_type="geocode", tier="storage", result="miss"
+            )
+        except Exception as e:
+            logging.exception("Couldn't get geocodes from storage - %s", e)
+
+    locations = {}
+    for city, doc in geocodes.items():
+        if doc.get("not_found"):
+            locations[city] = CityNotFoundException(names.get(city, city))
+            continue
+        if is_stale(doc):
+            revalidate(("geocode", city), fetch_lat_lon, city)
+        locations[city] = (location_key(doc["lat"], doc["lon"]), doc["lat"], doc["lon"])
+
+    to_fetch = [city for city in cities if city not in geocodes]
+    fetched = await gather_bounded(
+        [partial(in_flight.do, ("geocode", city), fetch_lat_lon, city) for city in to_fetch],
+        FANOUT_LIMIT,
+        FANOUT_ITEM_TIMEOUT
+    )
+    for city, result in zip(to_fetch, fetched):
+        if isinstance(result, CityNotFoundException):
+            result = CityNotFoundException(names.get(city, city))
+        locations[city] = result if isinstance(result, Exception) else (location_key(*result), *result)
+    return {city: locations[city] for city in cities}
+
+async def fetch_lat_lon(city):
+    logging.info("Fetching geocode data for city: %s", city)
+    name, country_code = split_country_code(city)
+    params = {"name": name}
+    if country_code:
+        params["countryCode"] = country_code
+    with Span("geocode_api"):
+        response = await upstream_client.get(GEOCODING_API_URL, params=params, name="geocoding")
 
     if response.status_code != 200:
-        logging.error(f"Failed to fetch geocode data for city: {city}")
+        logging.error("Failed to fetch geocode data for city: %s", city)
         raise WeatherAppException("Geocoding API request failed.")
 
-    data = response.json()
+    with Span("json_parse"):
+        data = response.json()
 
     if not data.get("results"):
-        logging.error(f"City '{city}' not found in open-meteo geocoding API.")
-        raise WeatherAppException(f"City '{city}' not found.")
+        logging.error("City '%s' not found in open-meteo geocoding API.", city)
+        l1_cache.set(("geocode", city, None), {"not_found": True}, ttl=L1_NEGATIVE_CACHE_TTL)
+        raise CityNotFoundException(city)
 
     lat = data["results"][0]["latitude"]
     lon = data["results"][0]["longitude"]
     await insert_geocode(city, lat, lon)
-    logging.debug(f"Geocode data for city '{city}': lat={lat}, lon={lon}")
+    logging.debug("Geocode data for city '%s': lat=%s, lon=%s", city, lat, lon)
     return lat, lon
 
 async def insert_geocode(city, lat, lon):
+    expiry = cache_expiry("geocode")
+    l1_cache.set(("geocode", city, None), {"cache_type": "geocode", "city": city, "lat": lat, "lon": lon, **expiry})
     try:
-        await cache_collection.insert_one({
-            "cache_type": "geocode",
-            "city": city,
-            "lat": lat,
-            "lon": lon
-        })
+        with Span("storage_write"):
+            await storage.save_geocode(city, {"lat": lat, "lon": lon, **expiry})
     except Exception as e:
-        logging.exception(f"Error occurred while inserting city geocode - {str(e)}")
+        logging.exception("Error occurred while inserting city geocode - %s", e)
 
-async def get_weather_data(city, month):
-    weather_cache_temp = await check_cache("weather", city, month)
-    if weather_cache_temp:
-        logging.debug(f"Weather cache hit for city and month: {city}-{month}")
-        return (weather_cache_temp["min_temp_avg"], weather_cache_temp["max_temp_avg"])
+def covers_window(weather_doc):
+    return weather_doc.get("start_date") == START_DATE and weather_doc.get("end_date") == END_DATE
+
+def remember_weather(weather_doc):
+    l1_cache.set(("weather", weather_doc["city"], weather_doc["month"]), weather_doc)
+    # Entries keyed by the raw city name (before location keys) have no `name`; they are never
+    # read again and are left to expire.
+    if covers_window(weather_doc) and "name" in weather_doc:
+        profile_index.update(
+            weather_doc["city"],
+            weather_doc["name"],
+            weather_doc["month"],
+            weather_doc["min_temp_avg"],
+            weather_doc["max_temp_avg"]
+        )
+
+def index_weather_docs(docs):
+    for doc in docs:
+        if "name" in doc:
+            profile_index.update(doc["city"], doc["name"], doc["month"], doc["min_temp_avg"], doc["max_temp_avg"])
+
+async def build_profile_index():
+    """Load the search index from storage, retrying with exponential backoff until it succeeds."""
+    global profile_index_loaded_at
+    started = time.time()
+    docs = await retry_with_backoff(
+        "build profile index from storage", storage.find_window_weather, START_DATE, END_DATE
+    )
+    index_weather_docs(docs)
+    profile_index_loaded_at = started
+    logging.info("Profile index built with %s cities.", len(profile_index))
+    startup_timings.mark("profile_index_loaded")
+
+async def reload_profile_index():
+    """Add the weather entries cached since the last load, by this worker or any other.
+
+    An entry written at time t has `fresh_until` t + WEATHER_FRESH_TTL, so those are the entries
+    fresh until later than the last load + WEATHER_FRESH_TTL. One reload interval of overlap covers
+    writes that were in progress during the last load and small clock differences between hosts.
+    """
+    global profile_index_loaded_at
+    started = time.time()
+    docs = await storage.find_window_weather(
+        START_DATE, END_DATE,
+        fresh_after=profile_index_loaded_at + WEATHER_FRESH_TTL - PROFILE_INDEX_RELOAD_INTERVAL
+    )
+    index_weather_docs(docs)
+    profile_index_loaded_at = started
+    logging.debug("Profile index reloaded %s weather entries, %s cities indexed.", len(docs), len(profile_index))
+
+async def profile_index_reload_loop():
+    """Keep the search index of every worker in step with the shared storage, not only with what
+    this worker cached itself."""
+    while True:
+        await asyncio.sleep(PROFILE_INDEX_RELOAD_INTERVAL)
+        if profile_index_loaded_at is None:
+            continue
+        try:
+            await reload_profile_index()
+        except Exception as e:
+            logging.exception("Couldn't reload profile index from storage - %s", e)
 
-    lat, lon = await get_lat_lon(city)
-    logging.info(f"Fetching weather data for city: {city}, month: {month}")
+async def start_profile_index_builder():
+    global profile_index_task, profile_index_reload_task
+    profile_index_task = asyncio.create_task(build_profile_index())
+    if PROFILE_INDEX_RELOAD_INTERVAL > 0:
+        profile_index_reload_task = asyncio.create_task(profile_index_reload_loop())
 
-    url = (
-        f"https://archive-api.open-meteo.com/v1/archive"
-        f"?latitude={lat}&longitude={lon}"
-        f"&start_date={START_DATE}&end_date={END_DATE}"
-        f"&daily=temperature_2m_min,temperature_2m_max&timezone=UTC"
+async def stop_profile_index_builder():
+    for task in (profile_index_task, profile_index_reload_task):
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+async def popular_cities():
+    """Cities to warm up: the configured WARMUP_CITIES first, then the most requested cached cities."""
+    cities = list(WARMUP_CITIES)
+    if WARMUP_TOP_CITIES > 0:
+        try:
+            cities.extend(await storage.top_cities(WARMUP_TOP_CITIES))
+        except Exception as e:
+            logging.exception("Couldn't get popular cities from storage - %s", e)
+    return list(dict.fromkeys(normalize_city(city) for city in cities))
+
+WARMUP_LEASE = "warmup"
+# Identifies this worker as the holder of a storage lease, across hosts sharing one database.
+lease_owner = f"{socket.gethostname()}:{os.getpid()}"
+
+async def hold_warmup_lease():
+    try:
+        return await storage.acquire_lease(WARMUP_LEASE, lease_owner, WARMUP_LEASE_TTL)
+    except Exception as e:
+        logging.exception("Couldn't acquire the warm-up lease - %s", e)
+        return False
+
+async def warm_up():
+    """Fetch popular cities into the cache, in one worker only.
+
+    SingleFlight only coalesces fetches within a process, so the workers sharing a storage backend
+    elect one through the storage lease; the others leave warm-up to it. The lease is renewed before
+    each city, so if the warming worker dies, the next deploy or restart can take over.
+    """
+    if not await hold_warmup_lease():
+        warmup_progress.update(state="other_worker", current=None)
+        logging.info("Cache warm-up is run by another worker.")
+        return
+
+    try:
+        await warm_up_cities()
+    finally:
+        try:
+            await storage.release_lease(WARMUP_LEASE, lease_owner)
+        except Exception as e:
+            logging.exception("Couldn't release the warm-up lease - %s", e)
+
+async def warm_up_cities():
+    cities = await popular_cities()
+    warmup_progress.update(state="running", total=len(cities), completed=0, skipped=0, failed=0, current=None)
+    logging.info("Warming up cache for %s cities.", len(cities))
+
+    for city in cities:
+        warmup_progress["current"] = city
+        if not await hold_warmup_lease():
+            warmup_progress.update(state="other_worker", current=None)
+            logging.warning("Lost the warm-up lease, leaving warm-up to another worker.")
+            return
+        try:
+            location, _, _ = await get_location(city)
+            cached_months = await check_cache_months(location)
+            if len(cached_months) == 12 and all(
+                covers_window(doc) and not is_stale(doc) for doc in cached_months.values()
+            ):
+                warmup_progress["skipped"] += 1
+                continue
+
+            await get_all_weather_data(city)
+            warmup_progress["completed"] += 1
+        except Exception as e:
+            warmup_progress["failed"] += 1
+            logging.warning("Couldn't warm up city: %s - %s", city, e)
+        # Pace upstream fetches so warm-up never competes with live traffic for the rate limit.
+        await asyncio.sleep(WARMUP_INTERVAL)
+
+    warmup_progress.update(state="done", current=None)
+    startup_timings.mark("warmup_done")
+    logging.info(
+        "Cache warm-up done: %s fetched, %s already cached, %s failed.",
+        warmup_progress["completed"], warmup_progress["skipped"], warmup_progress["failed"]
     )
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
+
+async def start_warmup():
+    global warmup_task
+    warmup_task = asyncio.create_task(warm_up())
+
+async def stop_warmup():
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+        try:
+            await warmup_task
+        except asyncio.CancelledError:
+            pass
+        warmup_progress.update(state="cancelled", current=None)
+        logging.info("Cache warm-up cancelled.")
+
+async def get_weather_data(city, month, name=None):
+    """Monthly averages of a normalized city name; `name` is the display name to cache them under."""
+    location, lat, lon = await get_location(city, name)
+    weather_cache_temp = await check_cache("weather", location, month)
+    if weather_cache_temp and covers_window(weather_cache_temp):
+        logging.debug("Weather cache hit for city and month: %s-%s", city, month)
+        if is_stale(weather_cache_temp):
+            revalidate(("weather", location), refresh_monthly_profiles, city, lat, lon, name)
+        return (weather_cache_temp["min_temp_avg"], weather_cache_temp["max_temp_avg"])
+
+    monthly_profiles = await in_flight.do(("weather", location), fetch_monthly_profiles, city, lat, lon, name)
+
+    if month not in monthly_profiles:
+        logging.warning("No data for city: %s, month: %s", city, month)
+        raise WeatherAppException("No data for the specified month.")
+
+    return monthly_profiles[month]
+
+async def get_all_weather_data(city, name=None):
+    location, lat, lon = await get_location(city, name)
+    cached_months = await check_cache_months(location)
+    if len(cached_months) == 12 and all(covers_window(doc) for doc in cached_months.values()):
+        logging.debug("Weather cache hit for all months of city: %s", city)
+        if any(is_stale(doc) for doc in cached_months.values()):
+            revalidate(("weather", location), refresh_monthly_profiles, city, lat, lon, name)
+        return {
+            month: (doc["min_temp_avg"], doc["max_temp_avg"])
+            for month, doc in cached_months.items()
+        }
+
+    monthly_profiles = await in_flight.do(("weather", location), fetch_monthly_profiles, city, lat, lon, name)
+
+    if len(monthly_profiles) != 12:
+        logging.warning("Incomplete monthly data for city: %s", city)
+        raise WeatherAppException("No data for the specified month.")
+
+    return monthly_profiles
+
+async def fetch_monthly_profiles(city, lat, lon, name=None):
+    cached_months = await check_cache_months(location_key(lat, lon))
+    name = name or cached_name(cached_months, city)
+    previous = previous_totals(cached_months)
+
+    if previous is None:
+        dates, series = await get_daily_series(city)
+        with Span("aggregation"):
+            totals = monthly_totals(dates, series["temperature_2m_min"], series["temperature_2m_max"])
+    else:
+        # Update the cached running totals with only the days that entered or left the window.
+        previous_start, previous_end, totals = previous
+        logging.info(
+            "Refreshing weather data for city: %s from %s..%s to %s..%s",
+            city, previous_start, previous_end, START_DATE, END_DATE
+        )
+        dates, series = await get_daily_series(
+            city, min(START_DATE, previous_start), max(END_DATE, previous_end)
+        )
+        with Span("aggregation"):
+            in_window = (dates >= np.datetime64(START_DATE)) & (dates <= np.datetime64(END_DATE))
+            in_previous = (dates >= np.datetime64(previous_start)) & (dates <= np.datetime64(previous_end))
+            for mask, sign in ((in_window & ~in_previous, 1), (in_previous & ~in_window, -1)):
+                if mask.any():
+                    delta = monthly_totals(
+                        dates[mask],
+                        series["temperature_2m_min"][mask],
+                        series["temperature_2m_max"][mask]
+                    )
+                    totals = add_totals(totals, delta, sign)
+
+    with Span("aggregation"):
+        monthly_profiles = profiles_from_totals(totals)
+    await insert_weather(name, lat, lon, totals)
+    logging.debug("Weather data for %s: %s", city, monthly_profiles)
+    return monthly_profiles
+
+async def refresh_monthly_profiles(city, lat, lon, name=None):
+    """Recompute the monthly averages of a cached location from its daily series.
+
+    Only days within ARCHIVE_REVISION_DAYS of today, which Open-Meteo may still revise, and days
+    missing from the stored series are downloaded again. A historical window costs no request.
+    """
+    name = name or cached_name(await check_cache_months(location_key(lat, lon)), city)
+    series_doc = await check_series(lat, lon)
+    start_date, end_date = START_DATE, END_DATE
+    final_until = shift_date(datetime.now(timezone.utc).date().isoformat(), -ARCHIVE_REVISION_DAYS - 1)
+    if series_doc:
+        start_date = min(start_date, series_doc["start_date"])
+        end_date = max(end_date, series_doc["end_date"])
+        kept_end = min(series_doc["end_date"], final_until)
+
+    if not series_doc or kept_end < series_doc["start_date"]:
+        series_doc = series_document(lat, lon, start_date, await fetch_archive(city, lat, lon, start_date, end_date))
+        await insert_series(series_doc)
+    else:
+        _, series = select_series(*series_from_document(series_doc), series_doc["start_date"], kept_end)
+        before = after = None
+        if start_date < series_doc["start_date"]:
+            before = await fetch_archive(city, lat, lon, start_date, shift_date(series_doc["start_date"], -1))
+        if kept_end < end_date:
+            after = await fetch_archive(city, lat, lon, shift_date(kept_end, 1), end_date)
+        if before is not None or after is not None:
+            series_doc = series_document(lat, lon, start_date, extend_series(series, before, after))
+            await insert_series(series_doc)
+        else:
+            logging.debug("Daily series of %s are final, recomputing without a download", city)
+
+    with Span("aggregation"):
+        dates, series = select_series(*series_from_document(series_doc), START_DATE, END_DATE)
+        totals = monthly_totals(dates, series["temperature_2m_min"], series["temperature_2m_max"])
+    await insert_weather(name, lat, lon, totals)
+    return profiles_from_totals(totals)
+
+def cached_name(weather_docs, city):
+    """The display name a location's weather entries carry, or the normalized city name if none."""
+    for doc in weather_docs.values():
+        if "name" in doc:
+            return doc["name"]
+    return city
+
+def previous_totals(weather_docs):
+    """Return (start_date, end_date, totals) from cached weather entries, if they all carry running totals."""
+    docs = list(weather_docs.values())
+    if not docs or not all("min_temp_count" in doc and "start_date" in doc for doc in docs):
+        return None
+    if len({(doc["start_date"], doc["end_date"]) for doc in docs}) != 1:
+        return None
+
+    totals = {
+        "min_temp": (np.zeros(13), np.zeros(13, dtype=np.int64)),
+        "max_temp": (np.zeros(13), np.zeros(13, dtype=np.int64)),
+    }
+    for doc in docs:
+        for key, (sums, counts) in totals.items():
+            sums[doc["month"]] = doc[f"{key}_sum"]
+            counts[doc["month"]] = doc[f"{key}_count"]
+    return docs[0]["start_date"], docs[0]["end_date"], totals
+
+async def get_daily_series(city, start_date=START_DATE, end_date=END_DATE, name=None):
+    lat, lon = await get_lat_lon(city, name)
+    series_doc = await check_series(lat, lon)
+    if series_doc and series_doc["start_date"] <= start_date and series_doc["end_date"] >= end_date:
+        logging.debug("Daily series cache hit for city: %s", city)
+        dates, series = series_from_document(series_doc)
+    else:
+        dates, series = await in_flight.do(
+            ("series", location_key(lat, lon), start_date, end_date),
+            extend_daily_series, city, lat, lon, series_doc, start_date, end_date
+        )
+    return select_series(dates, series, start_date, end_date)
+
+async def extend_daily_series(city, lat, lon, series_doc, start_date, end_date):
+    if not series_doc:
+        series_start = start_date
+        series = await fetch_archive(city, lat, lon, start_date, end_date)
+    else:
+        # Only download the days missing before and after what is already stored.
+        series_start = min(start_date, series_doc["start_date"])
+        _, series = series_from_document(series_doc)
+        before = after = None
+        if start_date < series_doc["start_date"]:
+            before = await fetch_archive(city, lat, lon, start_date, shift_date(series_doc["start_date"], -1))
+        if end_date > series_doc["end_date"]:
+            after = await fetch_archive(city, lat, lon, shift_date(series_doc["end_date"], 1), end_date)
+        series = extend_series(series, before, after)
+
+    series_doc = series_document(lat, lon, series_start, series)
+    await insert_series(series_doc)
+    return series_from_document(series_doc)
+
+async def fetch_archive(city, lat, lon, start_date, end_date):
+    logging.info("Fetching weather data for city: %s from %s to %s", city, start_date, end_date)
+
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": start_date,
+        "end_date": end_date,
+        "daily": ",".join(SERIES_FIELDS),
+        "timezone": "UTC",
+    }
+    with Span("archive_api"):
+        response = await upstream_client.get(ARCHIVE_API_URL, params=params, name="archive")
 
     if response.status_code != 200:
-        logging.error(f"Failed to fetch weather data for city: {city}")
+        logging.error("Failed to fetch weather data for city: %s", city)
         raise WeatherAppException("Weather API request failed.")
 
-    data = response.json()
+    with Span("json_parse"):
+        data = response.json()
 
     if "daily" not in data:
-        logging.error(f"Weather data not available for city: {city}")
+        logging.error("Weather data not available for city: %s", city)
         raise WeatherAppException("Weather data not available.")
 
-    dates = data["daily"]["time"]
-    min_temps = data["daily"]["temperature_2m_min"]
-    max_temps = data["daily"]["temperature_2m_max"]
+    with Span("json_parse"):
+        return series_from_archive(data["daily"], start_date, end_date)
 
-    min_temps_month = [
-        temp for date, temp in zip(dates, min_temps) if int(date.split("-")[1]) == month
-    ]
-    max_temps_month = [
-        temp for date, temp in zip(dates, max_temps) if int(date.split("-")[1]) == month
-    ]
-
-    if not min_temps_month or not max_temps_month:
-        logging.warning(f"No data for city: {city}, month: {month}")
-        raise WeatherAppException("No data for the specified month.")
+async def check_series(lat, lon):
+    try:
+        with Span("storage_read"):
+            result = await storage.find_series(location_key(lat, lon))
+        registry.inc("weather_cache_lookups", cache_type="series", tier="storage", result="hit" if result else "miss")
+        if not result:
+            return False
+        return result
+    except Exception as e:
+        logging.exception("Couldn't get daily series from storage - %s", e)
 
-    min_temp_avg = round(statistics.mean(min_temps_month), 2)
-    max_temp_avg = round(statistics.mean(max_temps_month), 2)
+async def insert_series(series_doc):
+    try:
+        with Span("storage_write"):
+            await storage.save_series(series_doc)
+        logging.info(
+            "Stored %s days of series for %s in %s bytes",
+            series_doc["days"], series_doc["_id"], series_doc["nbytes"]
+        )
+    except Exception as e:
+        logging.exception("Error occurred while inserting daily series - %s", e)
 
-    await insert_weather(city, month, min_temp_avg, max_temp_avg)
-    logging.debug(
-        f"Weather data for {city}, month {month}: "
-        f"min_avg={min_temp_avg}, max_avg={max_temp_avg}"
-    )
-    return min_temp_avg, max_temp_avg
+async def insert_weather(name, lat, lon, totals):
+    """Cache monthly profiles under the location, so every alias of the city shares them.
 
-async def insert_weather(city, month, min_temp_avg, max_temp_avg):
-    try:
-        await cache_collection.insert_one({
+    `name` is the display name the location is listed under in searches.
+    """
+    location = location_key(lat, lon)
+    expiry = cache_expiry("weather")
+    weather_docs = []
+    for month, (min_temp_avg, max_temp_avg) in profiles_from_totals(totals).items():
+        weather_doc = {
             "cache_type": "weather",
-            "city": city,
+            "city": location,
+            "name": name,
+            "lat": lat,
+            "lon": lon,
             "month": month,
             "min_temp_avg": min_temp_avg,
-            "max_temp_avg": max_temp_avg
-        })
+            "max_temp_avg": max_temp_avg,
+            "start_date": START_DATE,
+            "end_date": END_DATE,
+            **expiry
+        }
+        for key, (sums, counts) in totals.items():
+            weather_doc[f"{key}_sum"] = float(sums[month])
+            weather_doc[f"{key}_count"] = int(counts[month])
+        remember_weather(weather_doc)
+        weather_docs.append(weather_doc)
+
+    try:
+        with Span("storage_write"):
+            await storage.save_weather(location, weather_docs)
     except Exception as e:
-        logging.exception(f"Error occurred while inserting city and month weather - {str(e)}")
+        logging.exception("Error occurred while inserting city monthly weather - %s", e)
 
 async def retrieve_metrics():
-    response = {"routes": {}}
+    response = {
+        "routes": {},
+        "stages": stage_histograms.snapshot(),
+        "cache": l1_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "warmup": dict(warmup_progress),
+    }
+    await flush_metrics()
     try:
-        docs = metrics_collection.find()
-
-        async for doc in docs:
-            for route, data in doc.items():
-                if route == "_id":
-                    continue
-
-                hits = data.get("hits", 0)
-                errors = data.get("errors", 0)
-                times = data.get("times", [])
-
-                total_time = sum(times)
-                min_time = min(times) if times else 0.0
-                max_time = max(times) if times else 0.0
-                avg_time = round(total_time / hits, 4) if hits > 0 else 0.0
-
-                response["routes"][route] = {
-                    "route_name": data.get("route_name", route),
-                    "hits": hits,
-                    "errors": errors,
-                    "avg_time": avg_time,
-                    "max_time": round(max_time, 4),
-                    "min_time": round(min_time, 4),
-                }
+        routes = await storage.load_route_metrics()
+        for route, data in routes.items():
+            hits = data.get("hits", 0)
+            errors = data.get("errors", 0)
+            buckets = data.get("buckets", {})
+
+            count = sum(buckets.values())
+            total_time = data.get("total_time", 0.0)
+            min_time = data.get("min_time", 0.0)
+            max_time = data.get("max_time", 0.0)
+            avg_time = round(total_time / hits, 4) if hits > 0 else 0.0
+            mean_time = round(total_time / count, 4) if count > 0 else 0.0
+            percentiles = histogram_percentiles(buckets, min_time, max_time)
+
+            response["routes"][route] = {
+                "route_name": data.get("route_name", route),
+                "hits": hits,
+                "errors": errors,
+                "avg_time": avg_time,
+                "max_time": round(max_time, 4),
+                "min_time": round(min_time, 4),
+                "count": count,
+                "mean": mean_time,
+                **{name: round(value, 4) for name, value in percentiles.items()},
+            }
         return response
     except Exception as e:
-        logging.exception(f"Error retrieving metrics: {e}")
+        logging.exception("Error retrieving metrics: %s", e)
         raise WeatherAppException("Failed to retrieve metrics")
 
+def task_state(task):
+    if task is None:
+        return "pending"
+    if not task.done():
+        return "running"
+    if task.cancelled():
+        return "cancelled"
+    return "failed" if task.exception() is not None else "done"
 
-async def monthly_weather_profile_service(city, month):
-    if not city or not month:
+def health_status():
+    """Liveness: answers without any I/O, reporting the last known dependency checks."""
+    return {
+        "status": "ok",
+        "uptime_seconds": round(time.perf_counter() - startup_timings.started, 2),
+        "checks": {"storage": storage_check.last_result(), "upstream": upstream_check.last_result()},
+    }
+
+async def readiness_status():
+    """Readiness: startup work finished and dependencies reachable, with checks cached for HEALTH_CHECK_TTL.
+
+    Open-Meteo's result comes from the last request any route made to it. It is only probed when
+    READY_REQUIRE_UPSTREAM is set and it has seen no traffic for UPSTREAM_CHECK_TTL.
+    """
+    if READY_REQUIRE_UPSTREAM:
+        storage_result, upstream_result = await asyncio.gather(storage_check.result(), upstream_check.result())
+    else:
+        storage_result, upstream_result = await storage_check.result(), upstream_check.last_result()
+    startup = {
+        "storage_setup": task_state(storage_setup_task),
+        "profile_index": task_state(profile_index_task),
+        "warmup": task_state(warmup_task),
+    }
+
+    reasons = []
+    if startup["storage_setup"] != "done":
+        reasons.append(f"storage setup is {startup['storage_setup']}")
+    if startup["profile_index"] != "done":
+        reasons.append(f"search index load is {startup['profile_index']}")
+    if READY_REQUIRE_WARMUP and startup["warmup"] != "done":
+        reasons.append(f"cache warm-up is {startup['warmup']}")
+    if not storage_result["ok"]:
+        reasons.append("storage is unreachable")
+    if READY_REQUIRE_UPSTREAM and not upstream_result["ok"]:
+        reasons.append("Open-Meteo is unreachable")
+
+    ready = not reasons
+    if ready and "ready" not in startup_timings.milestones:
+        logging.info("Worker ready %.2fs after start: %s", startup_timings.mark("ready"), startup_timings.snapshot())
+    response = {
+        "status": "ready" if ready else "not ready",
+        "startup": startup,
+        "checks": {"storage": storage_result, "upstream": upstream_result},
+        "startup_seconds": startup_timings.snapshot(),
+    }
+    if reasons:
+        response["reasons"] = reasons
+    return ready, response
+
+
+def validate_monthly_profile_params(city, month):
+    if not isinstance(city, str) or not normalize_city(city) or not month:
         logging.error("Missing required parameters: city or month.")
         raise WeatherAppException("City and month parameters are required.")
 
     month = int(month)
     if not 1 <= month <= 12:
-        logging.error(f"Invalid month value: {month}")
+        logging.error("Invalid month value: %s", month)
         raise WeatherAppException("Invalid month. Month must be between 1 and 12.")
 
-    min_temp_avg, max_temp_avg = await get_weather_data(city, month)
+    return city, month
+
+async def monthly_weather_profile_service(city, month):
+    city, month = validate_monthly_profile_params(city, month)
+    city_key = normalize_city(city)
+    record_city_hits([city_key])
+
+    min_temp_avg, max_temp_avg = await get_weather_data(city_key, month, city.strip())
     response = {
         "city": city,
         "month": month,
@@ -200,6 +1019,108 @@ async def monthly_weather_profile_service(city, month):
     }
     return response
 
+async def batch_monthly_profile_service(items):
+    if not isinstance(items, list) or not items:
+        logging.error("Missing or invalid items for batch monthly profile.")
+        raise WeatherAppException("Items must be a non-empty list of {city, month} objects.")
+    if len(items) > BATCH_MAX_ITEMS:
+        logging.error("Too many batch items: %s", len(items))
+        raise WeatherAppException(f"At most {BATCH_MAX_ITEMS} items are allowed per batch.")
+
+    results = []
+    valid_items = []
+    display_names = {}
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({"error": "Each item must be an object with city and month."})
+            continue
+        try:
+            city, month = validate_monthly_profile_params(item.get("city"), item.get("month"))
+        except (WeatherAppException, ValueError, TypeError) as e:
+            results.append({"city": item.get("city"), "month": item.get("month"), "error": str(e)})
+            continue
+        results.append({"city": city, "month": month})
+        valid_items.append((len(results) - 1, normalize_city(city), month))
+        display_names.setdefault(normalize_city(city), city.strip())
+
+    record_city_hits({city for _, city, _ in valid_items})
+    locations = await get_locations((city for _, city, _ in valid_items), display_names)
+
+    located_items = []
+    resolved = {}
+    for index, city, month in valid_items:
+        location = locations[city]
+        if isinstance(location, asyncio.TimeoutError):
+            results[index]["error"] = "Timed out fetching weather data."
+        elif isinstance(location, Exception):
+            results[index]["error"] = str(location)
+        else:
+            located_items.append((index, location[0], month))
+            resolved.setdefault(location[0], (city, *location[1:], display_names[city]))
+
+    cached = await check_cache_many({(location, month) for _, location, month in located_items})
+    cached = {key: doc for key, doc in cached.items() if covers_window(doc)}
+    for location in {location for (location, _), doc in cached.items() if is_stale(doc)}:
+        revalidate(("weather", location), refresh_monthly_profiles, *resolved[location])
+
+    missing_locations = list(dict.fromkeys(
+        location for _, location, month in located_items if (location, month) not in cached
+    ))
+    logging.info(
+        "Batch of %s items: %s distinct cities, %s cache hits, %s locations to fetch",
+        len(items), len(locations), len(cached), len(missing_locations)
+    )
+    fetched = dict(zip(missing_locations, await gather_bounded(
+        [
+            partial(in_flight.do, ("weather", location), fetch_monthly_profiles, *resolved[location])
+            for location in missing_locations
+        ],
+        FANOUT_LIMIT,
+        FANOUT_ITEM_TIMEOUT
+    )))
+
+    for index, location, month in located_items:
+        if (location, month) in cached:
+            doc = cached[(location, month)]
+            results[index].update(min_temp_avg=doc["min_temp_avg"], max_temp_avg=doc["max_temp_avg"])
+            continue
+
+        monthly_profiles = fetched[location]
+        if isinstance(monthly_profiles, asyncio.TimeoutError):
+            results[index]["error"] = "Timed out fetching weather data."
+        elif isinstance(monthly_profiles, Exception):
+            results[index]["error"] = str(monthly_profiles)
+        elif month not in monthly_profiles:
+            results[index]["error"] = "No data for the specified month."
+        else:
+            min_temp_avg, max_temp_avg = monthly_profiles[month]
+            results[index].update(min_temp_avg=min_temp_avg, max_temp_avg=max_temp_avg)
+
+    return {"results": results}
+
+async def monthly_statistics_service(city, month, percentiles):
+    city, month = validate_monthly_profile_params(city, month)
+
+    percentile_list = []
+    if percentiles:
+        percentile_list = [float(percentile) for percentile in percentiles.split(",")]
+        if not all(0 <= percentile <= 100 for percentile in percentile_list):
+            logging.error("Invalid percentiles: %s", percentiles)
+            raise WeatherAppException("Percentiles must be between 0 and 100.")
+
+    city_key = normalize_city(city)
+    record_city_hits([city_key])
+    dates, series = await get_daily_series(city_key, name=city.strip())
+    response = {"city": city, "month": month}
+    for field in SERIES_FIELDS:
+        with Span("aggregation"):
+            month_statistics = monthly_statistics(dates, series[field], percentile_list).get(month)
+        if not month_statistics:
+            logging.warning("No data for city: %s, month: %s", city, month)
+            raise WeatherAppException("No data for the specified month.")
+        response[field] = month_statistics
+    return response
+
 async def best_travel_month_service(city, min_temp, max_temp):
     if not city or min_temp is None or max_temp is None:
         logging.error("Missing required parameters: city, min_temp, or max_temp.")
@@ -210,14 +1131,17 @@ async def best_travel_month_service(city, min_temp, max_temp):
     min_temp = float(min_temp)
     max_temp = float(max_temp)
     logging.info(
-        f"Calculating best travel month for city: {city} with preferred temps: "
-        f"min={min_temp}, max={max_temp}"
+        "Calculating best travel month for city: %s with preferred temps: min=%s, max=%s",
+        city, min_temp, max_temp
     )
 
-    results = []
-    for month in range(1, 13):
-        min_avg, max_avg = await get_weather_data(city, month)
-        results.append((month, min_avg, max_avg))
+    city_key = normalize_city(city)
+    record_city_hits([city_key])
+    monthly_profiles = await get_all_weather_data(city_key, city.strip())
+    results = [
+        (month, min_avg, max_avg)
+        for month, (min_avg, max_avg) in sorted(monthly_profiles.items())
+    ]
 
     diffs = [
         (
@@ -239,6 +1163,42 @@ async def best_travel_month_service(city, min_temp, max_temp):
     }
     return response
 
+async def search_cities_service(month, min_temp, max_temp, limit):
+    if not month or min_temp is None or max_temp is None:
+        logging.error("Missing required parameters: month, min_temp, or max_temp.")
+        raise WeatherAppException("Month, min_temp, and max_temp parameters are required.")
+
+    month = int(month)
+    if not 1 <= month <= 12:
+        logging.error("Invalid month value: %s", month)
+        raise WeatherAppException("Invalid month. Month must be between 1 and 12.")
+
+    min_temp = float(min_temp)
+    max_temp = float(max_temp)
+    limit = int(limit) if limit else 10
+    if not 1 <= limit <= SEARCH_MAX_RESULTS:
+        logging.error("Invalid limit value: %s", limit)
+        raise WeatherAppException(f"Limit must be between 1 and {SEARCH_MAX_RESULTS}.")
+
+    with Span("search"):
+        matches = profile_index.search(month, min_temp, max_temp, limit)
+    response = {
+        "month": month,
+        "indexed_cities": len(profile_index),
+        "results": [
+            {
+                "city": city,
+                "min_temp_avg": round(min_avg, 2),
+                "max_temp_avg": round(max_avg, 2),
+                "min_temp_diff": round(min_diff, 2),
+                "max_temp_diff": round(max_diff, 2),
+                "overall_diff": round(overall_diff, 2),
+            }
+            for city, min_avg, max_avg, min_diff, max_diff, overall_diff in matches
+        ],
+    }
+    return response
+
 async def compare_cities_service(cities, month):
     if not cities or not month:
         logging.error("Missing required parameters: cities or month.")
@@ -246,22 +1206,43 @@ async def compare_cities_service(cities, month):
 
     month = int(month)
     if not 1 <= month <= 12:
-        logging.error(f"Invalid month value: {month}")
+        logging.error("Invalid month value: %s", month)
         raise WeatherAppException("Invalid month. Month must be between 1 and 12.")
 
     city_list = [city.strip() for city in cities.split(",")]
     if not 2 <= len(city_list) <= 5:
-        logging.error(f"Invalid number of cities: {len(city_list)}")
+        logging.error("Invalid number of cities: %s", len(city_list))
         raise WeatherAppException("Number of cities must be between 2 and 5.")
 
-    logging.info(f"Comparing cities: {city_list} for month: {month}")
+    logging.info("Comparing cities: %s for month: %s", city_list, month)
+    city_keys = [normalize_city(city) for city in city_list]
+    record_city_hits(set(city_keys))
+    results = await gather_bounded(
+        [partial(get_weather_data, city_key, month, city) for city_key, city in zip(city_keys, city_list)],
+        FANOUT_LIMIT,
+        FANOUT_ITEM_TIMEOUT
+    )
+
+    if all(isinstance(result, Exception) for result in results):
+        logging.error("Couldn't get weather data for any of the cities: %s", city_list)
+        if isinstance(results[0], asyncio.TimeoutError):
+            raise WeatherAppException("Timed out fetching weather data.")
+        raise results[0]
+
     response = {"month": month}
-    for city in city_list:
-        min_avg, max_avg = await get_weather_data(city, month)
-        response[city] = {
-            "min_temp_avg": min_avg,
-            "max_temp_avg": max_avg,
-        }
-        logging.debug(f"Added weather data for city: {city}")
+    for city, result in zip(city_list, results):
+        if isinstance(result, asyncio.TimeoutError):
+            logging.error("Timed out getting weather data for city: %s", city)
+            response[city] = {"error": "Timed out fetching weather data."}
+        elif isinstance(result, Exception):
+            logging.error("Failed to get weather data for city: %s - %s", city, result)
+            response[city] = {"error": str(result)}
+        else:
+            min_avg, max_avg = result
+            response[city] = {
+                "min_temp_avg": min_avg,
+                "max_temp_avg": max_avg,
+            }
+            logging.debug("Added weather data for city: %s", city)
 
-    return response
\ No newline at end of file
+    return response
@@ -0,0 +1,635 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from metrics import histogram_from_samples, merge_route_metrics
+from series import SERIES_FIELDS
+from config import STORAGE_BACKEND, SQLITE_PATH, DB_NAME, METRICS_DOCUMENT_ID, create_mongo_client
+
+# Every backend stores the same four kinds of data:
+# - cache entries, one per (cache_type, city, month); geocode entries are keyed by normalized city
+#   name and have month None, weather entries are keyed by location (series.location_key),
+# - daily series documents, keyed by location (see series.series_document),
+# - persisted route metrics, {route: {hits, errors, total_time, min_time, max_time, buckets}},
+# - leases, {name: (owner, expires_at)}, so that work like cache warm-up runs in one worker only.
+# Entries whose `expires_at` has passed are never returned.
+
+
+def is_expired(doc, now=None):
+    expires_at = doc.get("expires_at")
+    if expires_at is None:
+        return False
+    if isinstance(expires_at, datetime):
+        expires_at = expires_at.replace(tzinfo=expires_at.tzinfo or timezone.utc).timestamp()
+    return expires_at <= (time.time() if now is None else now)
+
+
+class MongoStorage:
+    """Cache, series and metrics in MongoDB collections (the production backend).
+
+    The client is created on first use, so importing this module never connects, and each
+    worker process creates its own client inside its own event loop.
+    """
+
+    name = "mongo"
+
+    def __init__(self, client_factory, db_name, metrics_id):
+        self.client_factory = client_factory
+        self.db_name = db_name
+        self.metrics_id = metrics_id
+        self._client = None
+
+    @property
+    def database(self):
+        if self._client is None:
+            self._client = self.client_factory()
+            logging.info("MongoDB client created.")
+        return self._client[self.db_name]
+
+    @property
+    def cache_collection(self):
+        return self.database["cache"]
+
+    @property
+    def series_collection(self):
+        return self.database["series"]
+
+    @property
+    def metrics_collection(self):
+        return self.database["metrics"]
+
+    @property
+    def leases_collection(self):
+        return self.database["leases"]
+
+    async def ping(self):
+        await self.database.command("ping")
+
+    async def ensure_indexes(self):
+        index_keys = [("cache_type", ASCENDING), ("city", ASCENDING), ("month", ASCENDING)]
+        try:
+            await self.cache_collection.create_index(index_keys, unique=True, name="cache_key")
+        except OperationFailure as e:
+            if getattr(e, "code", None) != 11000:
+                raise
+            logging.warning("Cache contains duplicate entries, removing them before indexing.")
+            await self.remove_duplicate_cache_entries()
+            await self.cache_collection.create_index(index_keys, unique=True, name="cache_key")
+        await self.cache_collection.create_index("expires_at", expireAfterSeconds=0, name="cache_expiry")
+        await self.cache_collection.create_index([("cache_type", ASCENDING), ("hits", DESCENDING)], name="cache_hits")
+        await self.cache_collection.create_index([("cache_type", ASCENDING), ("fresh_until", ASCENDING)], name="cache_fresh")
+
+    async def remove_duplicate_cache_entries(self):
+        pipeline = [
+            {"$group": {
+                "_id": {"cache_type": "$cache_type", "city": "$city", "month": "$month"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        removed = 0
+        async for group in self.cache_collection.aggregate(pipeline):
+            result = await self.cache_collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        logging.info("Removed %s duplicate cache entries.", removed)
+
+    async def backfill_expiry(self, cache_type, fields):
+        result = await self.cache_collection.update_many(
+            {"cache_type": cache_type, "expires_at": {"$exists": False}},
+            {"$set": fields}
+        )
+        return result.modified_count
+
+    async def find_cache(self, cache_type, city, month=None):
+        filter_query = {"cache_type": cache_type, "city": city}
+        if month is not None:
+            filter_query["month"] = month
+        return await self.cache_collection.find_one(filter_query, {"_id": 0})
+
+    async def find_geocodes(self, cities):
+        return await self.cache_collection.find(
+            {"cache_type": "geocode", "city": {"$in": list(cities)}}, {"_id": 0}
+        ).to_list(None)
+
+    async def find_weather(self, city):
+        return await self.cache_collection.find({"cache_type": "weather", "city": city}, {"_id": 0}).to_list(None)
+
+    async def find_weather_many(self, city_months):
+        return await self.cache_collection.find({
+            "cache_type": "weather",
+            "$or": [
+                {"city": city, "month": {"$in": sorted(months)}}
+                for city, months in city_months.items()
+            ]
+        }, {"_id": 0}).to_list(None)
+
+    async def find_window_weather(self, start_date, end_date, fresh_after=None):
+        """Weather entries of a date window; with `fresh_after`, only those whose `fresh_until` is later."""
+        query = {"cache_type": "weather", "start_date": start_date, "end_date": end_date}
+        if fresh_after is not None:
+            query["fresh_until"] = {"$gt": fresh_after}
+        return await self.cache_collection.find(
+            query,
+            {"_id": 0, "city": 1, "name": 1, "month": 1, "min_temp_avg": 1, "max_temp_avg": 1}
+        ).to_list(None)
+
+    async def top_cities(self, limit):
+        docs = self.cache_collection.find(
+            {"cache_type": "geocode", "hits": {"$gt": 0}},
+            {"_id": 0, "city": 1}
+        ).sort("hits", -1).limit(limit)
+        return [doc["city"] async for doc in docs]
+
+    async def save_geocode(self, city, fields):
+        await self.cache_collection.update_one(
+            {"cache_type": "geocode", "city": city},
+            {"$set": fields},
+            upsert=True
+        )
+
+    async def save_weather(self, city, weather_docs):
+        await self.cache_collection.bulk_write([
+            UpdateOne(
+                {"cache_type": "weather", "city": city, "month": weather_doc["month"]},
+                {"$set": weather_doc},
+                upsert=True
+            )
+            for weather_doc in weather_docs
+        ], ordered=False)
+
+    async def add_city_hits(self, hits):
+        await self.cache_collection.bulk_write([
+            UpdateOne({"cache_type": "geocode", "city": city}, {"$inc": {"hits": count}})
+            for city, count in hits.items()
+        ], ordered=False)
+
+    async def find_series(self, key):
+        return await self.series_collection.find_one({"_id": key})
+
+    async def save_series(self, series_doc):
+        await self.series_collection.replace_one({"_id": series_doc["_id"]}, series_doc, upsert=True)
+
+    async def add_route_metrics(self, routes):
+        update_query = {"$inc": {}, "$min": {}, "$max": {}, "$setOnInsert": {}}
+        for route, data in routes.items():
+            update_query["$inc"][f"{route}.hits"] = data["hits"]
+            update_query["$inc"][f"{route}.errors"] = data["errors"]
+            update_query["$inc"][f"{route}.total_time"] = data["total_time"]
+            for index, count in data["buckets"].items():
+                update_query["$inc"][f"{route}.buckets.{index}"] = count
+            update_query["$min"][f"{route}.min_time"] = data["min_time"]
+            update_query["$max"][f"{route}.max_time"] = data["max_time"]
+            update_query["$setOnInsert"][f"{route}.route_name"] = route
+
+        await self.metrics_collection.update_one({"_id": self.metrics_id}, update_query, upsert=True)
+
+    async def load_route_metrics(self):
+        routes = {}
+        async for doc in self.metrics_collection.find():
+            for route, data in doc.items():
+                if route != "_id":
+                    routes[route] = data
+        return routes
+
+    async def acquire_lease(self, name, owner, ttl):
+        """Take or renew the lease `name` for `ttl` seconds. False while another owner holds it."""
+        now = time.time()
+        try:
+            # With the lease held by someone else the filter matches nothing, and the upsert's
+            # insert of the same _id fails.
+            await self.leases_collection.update_one(
+                {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + ttl}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_lease(self, name, owner):
+        await self.leases_collection.delete_one({"_id": name, "owner": owner})
+
+    async def migrate_metrics(self):
+        """Fold legacy per-request `times` arrays into latency histograms, once."""
+        async for doc in self.metrics_collection.find():
+            for route, data in doc.items():
+                if route == "_id" or not isinstance(data.get("times"), list):
+                    continue
+
+                times = data["times"]
+                update_query = {
+                    "$inc": {f"{route}.total_time": sum(times)},
+                    "$unset": {f"{route}.times": ""}
+                }
+                for index, count in histogram_from_samples(times).items():
+                    update_query["$inc"][f"{route}.buckets.{index}"] = count
+
+                await self.metrics_collection.update_one(
+                    {"_id": doc["_id"], f"{route}.times": {"$exists": True}},
+                    update_query
+                )
+                logging.info("Migrated %s latency samples for route %s", len(times), route)
+
+    async def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class MemoryStorage:
+    """Everything in process dictionaries; nothing survives a restart. For tests and benchmarks."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._cache = {}
+        self._series = {}
+        self._metrics = {}
+        self._leases = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def ping(self):
+        pass
+
+    async def backfill_expiry(self, cache_type, fields):
+        return 0
+
+    def _get(self, key):
+        doc = self._cache.get(key)
+        if doc is not None and is_expired(doc):
+            del self._cache[key]
+            return None
+        return doc
+
+    async def find_cache(self, cache_type, city, month=None):
+        if month is None and cache_type == "weather":
+            docs = await self.find_weather(city)
+            return docs[0] if docs else None
+        doc = self._get((cache_type, city, month))
+        return copy.deepcopy(doc) if doc is not None else None
+
+    async def find_geocodes(self, cities):
+        return [dict(doc) for doc in (self._get(("geocode", city, None)) for city in cities) if doc is not None]
+
+    async def find_weather(self, city):
+        return [dict(doc) for doc in (self._get(("weather", city, month)) for month in range(1, 13)) if doc is not None]
+
+    async def find_weather_many(self, city_months):
+        return [
+            dict(doc)
+            for city, months in city_months.items()
+            for doc in (self._get(("weather", city, month)) for month in sorted(months))
+            if doc is not None
+        ]
+
+    async def find_window_weather(self, start_date, end_date, fresh_after=None):
+        return [
+            dict(doc) for (cache_type, _, _), doc in list(self._cache.items())
+            if cache_type == "weather" and doc.get("start_date") == start_date
+            and doc.get("end_date") == end_date and not is_expired(doc)
+            and (fresh_after is None or doc.get("fresh_until", 0) > fresh_after)
+        ]
+
+    async def top_cities(self, limit):
+        geocodes = [
+            doc for (cache_type, _, _), doc in self._cache.items()
+            if cache_type == "geocode" and doc.get("hits", 0) > 0
+        ]
+        return [doc["city"] for doc in sorted(geocodes, key=lambda doc: -doc["hits"])[:limit]]
+
+    async def save_geocode(self, city, fields):
+        doc = self._cache.setdefault(("geocode", city, None), {"cache_type": "geocode", "city": city})
+        doc.update(fields)
+
+    async def save_weather(self, city, weather_docs):
+        for weather_doc in weather_docs:
+            self._cache[("weather", city, weather_doc["month"])] = dict(weather_doc)
+
+    async def add_city_hits(self, hits):
+        for city, count in hits.items():
+            doc = self._cache.get(("geocode", city, None))
+            if doc is not None:
+                doc["hits"] = doc.get("hits", 0) + count
+
+    async def find_series(self, key):
+        return self._series.get(key)
+
+    async def save_series(self, series_doc):
+        self._series[series_doc["_id"]] = series_doc
+
+    async def add_route_metrics(self, routes):
+        for route, data in routes.items():
+            if route in self._metrics:
+                merge_route_metrics(self._metrics[route], data)
+            else:
+                self._metrics[route] = {**copy.deepcopy(data), "route_name": route}
+
+    async def load_route_metrics(self):
+        return copy.deepcopy(self._metrics)
+
+    async def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        holder, expires_at = self._leases.get(name, (owner, now))
+        if holder != owner and expires_at > now:
+            return False
+        self._leases[name] = (owner, now + ttl)
+        return True
+
+    async def release_lease(self, name, owner):
+        if self._leases.get(name, (None,))[0] == owner:
+            del self._leases[name]
+
+    async def migrate_metrics(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """Cache, series and metrics in a local SQLite file.
+
+    sqlite3 is blocking, so every call runs on one dedicated thread, which also serializes
+    access to the connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._connection = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(f"""
+                CREATE TABLE IF NOT EXISTS cache (
+                    cache_type TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    month INTEGER NOT NULL,
+                    doc TEXT NOT NULL,
+                    expires_at REAL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (cache_type, city, month)
+                );
+                CREATE INDEX IF NOT EXISTS cache_hits ON cache (cache_type, hits DESC);
+                CREATE TABLE IF NOT EXISTS series (
+                    key TEXT PRIMARY KEY,
+                    doc TEXT NOT NULL,
+                    {", ".join(f"{field} BLOB NOT NULL" for field in SERIES_FIELDS)}
+                );
+                CREATE TABLE IF NOT EXISTS metrics (
+                    route TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+            """)
+        return self._connection
+
+    # Geocode entries have no month; it is stored as 0 so the primary key stays unique.
+    @staticmethod
+    def _month(month):
+        return 0 if month is None else month
+
+    @staticmethod
+    def _row_doc(row):
+        doc, hits = row
+        doc = json.loads(doc)
+        if hits:
+            doc["hits"] = hits
+        return doc
+
+    @staticmethod
+    def _expires_at(doc):
+        expires_at = doc.get("expires_at")
+        if isinstance(expires_at, datetime):
+            return expires_at.timestamp()
+        return expires_at
+
+    def _upsert_cache(self, connection, cache_type, city, month, doc):
+        stored = {key: value for key, value in doc.items() if key not in ("expires_at", "hits")}
+        connection.execute(
+            "INSERT INTO cache (cache_type, city, month, doc, expires_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (cache_type, city, month) DO UPDATE SET doc = excluded.doc, expires_at = excluded.expires_at",
+            (cache_type, city, self._month(month), json.dumps(stored), self._expires_at(doc))
+        )
+
+    def _select_cache(self, where, params):
+        rows = self._connect().execute(
+            f"SELECT doc, hits FROM cache WHERE ({where}) AND (expires_at IS NULL OR expires_at > ?)",
+            (*params, time.time())
+        ).fetchall()
+        return [self._row_doc(row) for row in rows]
+
+    async def ensure_indexes(self):
+        await self._run(self._connect)
+
+    async def ping(self):
+        await self._run(lambda: self._connect().execute("SELECT 1").fetchone())
+
+    async def backfill_expiry(self, cache_type, fields):
+        def backfill():
+            connection = self._connect()
+            with connection:
+                rows = connection.execute(
+                    "SELECT city, month, doc FROM cache WHERE cache_type = ? AND expires_at IS NULL", (cache_type,)
+                ).fetchall()
+                for city, month, doc in rows:
+                    self._upsert_cache(connection, cache_type, city, month, {**json.loads(doc), **fields})
+            return len(rows)
+
+        return await self._run(backfill)
+
+    async def find_cache(self, cache_type, city, month=None):
+        if month is None and cache_type == "weather":
+            docs = await self.find_weather(city)
+        else:
+            docs = await self._run(
+                self._select_cache, "cache_type = ? AND city = ? AND month = ?", (cache_type, city, self._month(month))
+            )
+        return docs[0] if docs else None
+
+    async def find_geocodes(self, cities):
+        cities = list(cities)
+        return await self._run(
+            self._select_cache, f"cache_type = 'geocode' AND city IN ({', '.join('?' * len(cities))})", cities
+        )
+
+    async def find_weather(self, city):
+        return await self._run(self._select_cache, "cache_type = 'weather' AND city = ?", (city,))
+
+    async def find_weather_many(self, city_months):
+        where = " OR ".join(
+            f"(city = ? AND month IN ({', '.join('?' * len(months))}))" for months in city_months.values()
+        )
+        params = [value for city, months in city_months.items() for value in (city, *sorted(months))]
+        return await self._run(self._select_cache, f"cache_type = 'weather' AND ({where})", params)
+
+    async def find_window_weather(self, start_date, end_date, fresh_after=None):
+        if fresh_after is None:
+            docs = await self._run(self._select_cache, "cache_type = 'weather'", ())
+        else:
+            docs = await self._run(
+                self._select_cache, "cache_type = 'weather' AND json_extract(doc, '$.fresh_until') > ?", (fresh_after,)
+            )
+        return [doc for doc in docs if doc.get("start_date") == start_date and doc.get("end_date") == end_date]
+
+    async def top_cities(self, limit):
+        def select():
+            rows = self._connect().execute(
+                "SELECT city FROM cache WHERE cache_type = 'geocode' AND hits > 0 ORDER BY hits DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [city for city, in rows]
+
+        return await self._run(select)
+
+    async def save_geocode(self, city, fields):
+        def save():
+            connection = self._connect()
+            with connection:
+                row = connection.execute(
+                    "SELECT doc FROM cache WHERE cache_type = 'geocode' AND city = ? AND month = 0", (city,)
+                ).fetchone()
+                doc = json.loads(row[0]) if row else {"cache_type": "geocode", "city": city}
+                self._upsert_cache(connection, "geocode", city, None, {**doc, **fields})
+
+        await self._run(save)
+
+    async def save_weather(self, city, weather_docs):
+        def save():
+            connection = self._connect()
+            with connection:
+                for weather_doc in weather_docs:
+                    self._upsert_cache(connection, "weather", city, weather_doc["month"], weather_doc)
+
+        await self._run(save)
+
+    async def add_city_hits(self, hits):
+        def add():
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "UPDATE cache SET hits = hits + ? WHERE cache_type = 'geocode' AND city = ? AND month = 0",
+                    [(count, city) for city, count in hits.items()]
+                )
+
+        await self._run(add)
+
+    async def find_series(self, key):
+        def select():
+            row = self._connect().execute(
+                f"SELECT doc, {', '.join(SERIES_FIELDS)} FROM series WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            return {**json.loads(row[0]), **dict(zip(SERIES_FIELDS, row[1:]))}
+
+        return await self._run(select)
+
+    async def save_series(self, series_doc):
+        def save():
+            connection = self._connect()
+            meta = {key: value for key, value in series_doc.items() if key not in SERIES_FIELDS}
+            with connection:
+                connection.execute(
+                    f"INSERT OR REPLACE INTO series (key, doc, {', '.join(SERIES_FIELDS)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(SERIES_FIELDS))})",
+                    (series_doc["_id"], json.dumps(meta), *(series_doc[field] for field in SERIES_FIELDS))
+                )
+
+        await self._run(save)
+
+    async def add_route_metrics(self, routes):
+        def add():
+            connection = self._connect()
+            with connection:
+                for route, data in routes.items():
+                    row = connection.execute("SELECT data FROM metrics WHERE route = ?", (route,)).fetchone()
+                    if row is None:
+                        stored = {**data, "route_name": route}
+                    else:
+                        stored = json.loads(row[0])
+                        merge_route_metrics(stored, data)
+                    connection.execute(
+                        "INSERT OR REPLACE INTO metrics (route, data) VALUES (?, ?)", (route, json.dumps(stored))
+                    )
+
+        await self._run(add)
+
+    async def load_route_metrics(self):
+        def load():
+            rows = self._connect().execute("SELECT route, data FROM metrics").fetchall()
+            return {route: json.loads(data) for route, data in rows}
+
+        return await self._run(load)
+
+    async def acquire_lease(self, name, owner, ttl):
+        def acquire():
+            connection = self._connect()
+            now = time.time()
+            with connection:
+                connection.execute(
+                    "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                    (name, owner, now + ttl, now)
+                )
+                row = connection.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+            return row[0] == owner
+
+        return await self._run(acquire)
+
+    async def release_lease(self, name, owner):
+        def release():
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+        await self._run(release)
+
+    async def migrate_metrics(self):
+        pass
+
+    async def close(self):
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(close)
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    if backend == "mongo":
+        from bson import ObjectId
+        return MongoStorage(create_mongo_client, DB_NAME, ObjectId(METRICS_DOCUMENT_ID))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+storage = create_storage()
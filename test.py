@@ -1,8 +1,9 @@
+import os
 import requests
 import random
 import time
 
-BASE_URL = "http://13.60.52.33:5000" # or http://localhost:5000 to test locally
+BASE_URL = os.getenv("BASE_URL", "http://13.60.52.33:5000") # or http://localhost:5000 to test locally
 
 CITIES = [
     'New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix',
@@ -39,7 +40,40 @@ def test_weather_monthly_profile():
             assert_response(condition, test_name)
         except Exception as e:
             assert_response(False, test_name, error_message=str(e))
-        time.sleep(0.5) 
+        time.sleep(0.5)
+
+    total_tests += 1
+    test_name = "Test 6: Aliases of a city return the same profile"
+    city = random.choice(CITIES)
+    try:
+        profiles = [
+            requests.get(f"{BASE_URL}/weather/monthly-profile", params={'city': alias, 'month': 7}).json()
+            for alias in (city, f"  {city.upper()} ")
+        ]
+        condition = all('min_temp_avg' in profile for profile in profiles) and \
+            profiles[0]['min_temp_avg'] == profiles[1]['min_temp_avg'] and \
+            profiles[0]['max_temp_avg'] == profiles[1]['max_temp_avg']
+        assert_response(condition, test_name, error_message=str(profiles))
+    except Exception as e:
+        assert_response(False, test_name, error_message=str(e))
+
+    total_tests += 1
+    test_name = "Test 7: Conditional request returns 304"
+    try:
+        params = {'city': random.choice(CITIES), 'month': 3}
+        response = requests.get(f"{BASE_URL}/weather/monthly-profile", params=params)
+        etag = response.headers.get('ETag')
+        revalidated = requests.get(f"{BASE_URL}/weather/monthly-profile", params=params, headers={'If-None-Match': etag})
+        condition = (
+            response.status_code == 200
+            and etag is not None
+            and 'max-age' in response.headers.get('Cache-Control', '')
+            and revalidated.status_code == 304
+            and revalidated.headers.get('ETag') == etag
+        )
+        assert_response(condition, test_name, error_message=f"{response.status_code} {etag} {revalidated.status_code}")
+    except Exception as e:
+        assert_response(False, test_name, error_message=str(e))
 
 
     print("\nTesting error handling for /weather/monthly-profile")
@@ -59,6 +93,80 @@ def test_weather_monthly_profile():
         except Exception as e:
             assert_response(False, test_name, error_message=str(e))
 
+def test_weather_monthly_profiles_batch():
+    global total_tests
+    print("\nTesting /weather/monthly-profiles")
+    total_tests += 1
+    test_name = "Test 1: Valid batch request"
+    items = [{'city': city, 'month': random.randint(1, 12)} for city in random.sample(CITIES, 5)]
+    items.append({'city': 'New York', 'month': 13})
+    try:
+        response = requests.post(f"{BASE_URL}/weather/monthly-profiles", json={'items': items})
+        results = response.json().get('results', [])
+        condition = (
+            response.status_code == 200
+            and len(results) == len(items)
+            and all('min_temp_avg' in result for result in results[:-1])
+            and 'error' in results[-1]
+        )
+        assert_response(condition, test_name)
+    except Exception as e:
+        assert_response(False, test_name, error_message=str(e))
+
+    print("\nTesting error handling for /weather/monthly-profiles")
+    error_tests = [
+        {},
+        {'items': []},
+        {'items': [{'city': 'London', 'month': 1}] * 101},
+    ]
+    for i, body in enumerate(error_tests, start=1):
+        total_tests += 1
+        test_name = f"Error Test {i}: Invalid body"
+        try:
+            response = requests.post(f"{BASE_URL}/weather/monthly-profiles", json=body)
+            response_json = response.json()
+            condition = response.status_code == 400 and 'error' in response_json
+            assert_response(condition, test_name)
+        except Exception as e:
+            assert_response(False, test_name, error_message=str(e))
+
+def test_weather_monthly_stats():
+    global total_tests
+    print("\nTesting /weather/monthly-stats")
+    for i in range(3):
+        total_tests += 1
+        test_name = f"Test {i+1}: Valid request"
+        city = random.choice(CITIES)
+        month = random.randint(1, 12)
+        params = {'city': city, 'month': month, 'percentiles': '10,50,90'}
+        try:
+            response = requests.get(f"{BASE_URL}/weather/monthly-stats", params=params)
+            response_json = response.json()
+            condition = response.status_code == 200 and all(
+                'p50' in response_json.get(field, {}) for field in ('temperature_2m_min', 'temperature_2m_max')
+            )
+            assert_response(condition, test_name)
+        except Exception as e:
+            assert_response(False, test_name, error_message=str(e))
+        time.sleep(0.5)
+
+    print("\nTesting error handling for /weather/monthly-stats")
+    error_tests = [
+        {'month': 5},
+        {'city': 'New York', 'month': 13},
+        {'city': 'New York', 'month': 5, 'percentiles': '150'},
+    ]
+    for i, params in enumerate(error_tests, start=1):
+        total_tests += 1
+        test_name = f"Error Test {i}: Invalid parameters"
+        try:
+            response = requests.get(f"{BASE_URL}/weather/monthly-stats", params=params)
+            response_json = response.json()
+            condition = response.status_code == 400 and 'error' in response_json
+            assert_response(condition, test_name)
+        except Exception as e:
+            assert_response(False, test_name, error_message=str(e))
+
 def test_travel_best_month():
     global total_tests
     print("\nTesting /travel/best-month")
@@ -96,6 +204,41 @@ def test_travel_best_month():
         except Exception as e:
             assert_response(False, test_name, error_message=str(e))
 
+def test_travel_search():
+    global total_tests
+    print("\nTesting /travel/search")
+    for i in range(3):
+        total_tests += 1
+        test_name = f"Test {i+1}: Valid request"
+        month = random.randint(1, 12)
+        min_temp = round(random.uniform(-10, 25), 2)
+        max_temp = round(random.uniform(min_temp, min_temp + 15), 2)
+        params = {'month': month, 'min_temp': min_temp, 'max_temp': max_temp, 'limit': 5}
+        try:
+            response = requests.get(f"{BASE_URL}/travel/search", params=params)
+            response_json = response.json()
+            condition = response.status_code == 200 and len(response_json.get('results', [])) <= 5
+            assert_response(condition, test_name)
+        except Exception as e:
+            assert_response(False, test_name, error_message=str(e))
+
+    print("\nTesting error handling for /travel/search")
+    error_tests = [
+        {'month': 7, 'min_temp': 15},
+        {'month': 13, 'min_temp': 15, 'max_temp': 25},
+        {'month': 7, 'min_temp': 15, 'max_temp': 25, 'limit': 0},
+    ]
+    for i, params in enumerate(error_tests, start=1):
+        total_tests += 1
+        test_name = f"Error Test {i}: Invalid parameters"
+        try:
+            response = requests.get(f"{BASE_URL}/travel/search", params=params)
+            response_json = response.json()
+            condition = response.status_code == 400 and 'error' in response_json
+            assert_response(condition, test_name)
+        except Exception as e:
+            assert_response(False, test_name, error_message=str(e))
+
 def test_travel_compare_cities():
     global total_tests
     print("\nTesting /travel/compare-cities")
@@ -147,12 +290,54 @@ def test_metrics():
     except Exception as e:
         assert_response(False, test_name, error_message=str(e))
 
+    total_tests += 1
+    test_name = "Test 2: Retrieve OpenMetrics exposition"
+    try:
+        response = requests.get(f"{BASE_URL}/metrics", headers={'Accept': 'application/openmetrics-text'})
+        condition = (
+            response.status_code == 200
+            and response.headers.get('Content-Type', '').startswith('application/openmetrics-text')
+            and response.text.rstrip().endswith('# EOF')
+        )
+        assert_response(condition, test_name)
+    except Exception as e:
+        assert_response(False, test_name, error_message=str(e))
+
+def test_health():
+    global total_tests
+    print("\nTesting /healthz and /readyz")
+    total_tests += 1
+    test_name = "Test 1: Liveness"
+    try:
+        response = requests.get(f"{BASE_URL}/healthz")
+        condition = response.status_code == 200 and response.json().get('status') == 'ok'
+        assert_response(condition, test_name)
+    except Exception as e:
+        assert_response(False, test_name, error_message=str(e))
+
+    total_tests += 1
+    test_name = "Test 2: Readiness"
+    try:
+        response = requests.get(f"{BASE_URL}/readyz")
+        response_json = response.json()
+        condition = (
+            (response.status_code, response_json.get('status')) in ((200, 'ready'), (503, 'not ready'))
+            and 'storage' in response_json.get('checks', {})
+        )
+        assert_response(condition, test_name, error_message=str(response_json))
+    except Exception as e:
+        assert_response(False, test_name, error_message=str(e))
+
 def main():
     print("Starting tests...\n")
     test_weather_monthly_profile()
+    test_weather_monthly_profiles_batch()
+    test_weather_monthly_stats()
     test_travel_best_month()
     test_travel_compare_cities()
+    test_travel_search()
     test_metrics()
+    test_health()
     print("\nTests completed.\n")
     print("Test Summary:")
     print(f"Total Tests Run: {total_tests}")
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import time
+from metrics import StageHistograms
+from config import PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+stage_histograms = StageHistograms()
+
+# Stage durations of the current request, {stage: seconds}. Tasks spawned while handling a request
+# inherit the same dict, so work done on its behalf is attributed to it.
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Span:
+    """Time a stage of the request path: `with Span("mongo_read"): ...`.
+
+    Each span costs two perf_counter calls and a histogram update, cheap enough to leave on.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def record_stage(stage, elapsed_time):
+    stage_histograms.record(stage, elapsed_time)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed_time
+
+
+def start_request_timings():
+    request_timings.set({})
+
+
+def server_timing_header(total_time):
+    """Format the current request's stage timings as a `Server-Timing` header value (durations in ms).
+
+    Stages that ran concurrently are summed, so together they can exceed `total`.
+    """
+    timings = request_timings.get() or {}
+    entries = [f"{stage};dur={elapsed_time * 1000:.2f}" for stage, elapsed_time in timings.items()]
+    entries.append(f"total;dur={total_time * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class RequestProfiler:
+    """Profiles a random sample of requests with cProfile and writes each profile to `output_dir`.
+
+    cProfile sees the whole event loop thread, so a profile also contains whatever other requests
+    ran concurrently. Only one request is profiled at a time.
+    """
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, output_dir=PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self._active = None
+        self._profiled = 0
+
+    def maybe_start(self):
+        if self.sample_rate <= 0 or self._active is not None or random.random() >= self.sample_rate:
+            return None
+        self._active = cProfile.Profile()
+        self._active.enable()
+        return self._active
+
+    async def stop(self, profiler, name):
+        """Stop profiling and write the profile from a worker thread, off the event loop."""
+        profiler.disable()
+        self._active = None
+        self._profiled += 1
+        path = os.path.join(
+            self.output_dir,
+            f"{name.strip('/').replace('/', '_') or 'root'}-{time.strftime('%Y%m%d-%H%M%S')}"
+            f"-{os.getpid()}-{self._profiled}.prof"
+        )
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, profiler, path)
+            logging.info("Wrote request profile to %s", path)
+        except Exception as e:
+            logging.exception("Couldn't write request profile - %s", e)
+
+    def _write(self, profiler, path):
+        os.makedirs(self.output_dir, exist_ok=True)
+        profiler.dump_stats(path)
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import httpx
+from utils import WeatherAppException
+from openmetrics import registry
+from config import (
+    UPSTREAM_TIMEOUT,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_CONCURRENCY,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX
+)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Return the Retry-After header value in seconds, or None if it can't be parsed."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class UpstreamClient:
+    """Shared, pooled HTTP client for the Open-Meteo APIs.
+
+    A single keep-alive connection pool is reused by every request, the number
+    of concurrent upstream calls is capped, and transient failures are retried
+    with jittered exponential backoff (honoring Retry-After on 429/503).
+    """
+
+    def __init__(
+        self,
+        timeout=UPSTREAM_TIMEOUT,
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_concurrency=UPSTREAM_MAX_CONCURRENCY,
+        max_retries=UPSTREAM_MAX_RETRIES,
+        backoff_base=UPSTREAM_BACKOFF_BASE,
+        backoff_max=UPSTREAM_BACKOFF_MAX,
+        transport=None
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.transport = transport
+        self._client = None
+        self._semaphore = None
+        self._last_outcome = None
+        self._last_outcome_at = 0.0
+
+    def last_outcome(self):
+        """How the most recent Open-Meteo request went, as a health check result, and its monotonic time."""
+        return self._last_outcome, self._last_outcome_at
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            http2 = HTTP2_AVAILABLE and self.transport is None
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                http2=http2,
+                transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            logging.info("Upstream HTTP client created (http2=%s)", http2)
+        return self._client
+
+    def _backoff_delay(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get(self, url, params=None, name="upstream"):
+        client = self._get_client()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self._timed_get(client, url, params, name)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    logging.error("Upstream request to %s failed after %s attempts: %s", url, attempt + 1, e)
+                    raise WeatherAppException("Upstream request failed.")
+                delay = self._backoff_delay(attempt)
+                logging.warning("Upstream request to %s failed (%s), retrying in %.2fs", url, e, delay)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > self.backoff_max:
+                    logging.warning(
+                        "Upstream %s asked to retry after %.0fs, giving up", url, retry_after
+                    )
+                    return response
+                delay = retry_after if retry_after is not None else self._backoff_delay(attempt)
+                logging.warning(
+                    "Upstream %s returned %s, retrying in %.2fs", url, response.status_code, delay
+                )
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def ping(self, url, params=None):
+        """One request without retries or queueing, for health checks. Raises unless the API answers below 500."""
+        response = await self._timed_get(self._get_client(), url, params, "healthcheck")
+        if response.status_code >= 500:
+            raise WeatherAppException(f"Upstream returned {response.status_code}.")
+        return response
+
+    async def _timed_get(self, client, url, params, name):
+        registry.inc("weather_upstream_requests_in_flight", api=name)
+        start_time = time.perf_counter()
+        status = "error"
+        error = None
+        try:
+            response = await client.get(url, params=params)
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            registry.inc("weather_upstream_requests_in_flight", -1, api=name)
+            registry.inc("weather_upstream_requests", api=name, status=status)
+            registry.observe("weather_upstream_request_duration_seconds", elapsed_time, api=name)
+            # A cancelled request says nothing about Open-Meteo.
+            if status != "error" or error is not None:
+                self._record_outcome(status, error, elapsed_time, "probe" if name == "healthcheck" else "traffic")
+
+    def _record_outcome(self, status, error, elapsed_time, source):
+        """Remember the last request's outcome, so health checks can report it without probing.
+
+        Like `ping`, any answer below 500 counts as reachable.
+        """
+        if error is None and int(status) >= 500:
+            error = f"Upstream returned {status}."
+        outcome = {"ok": error is None}
+        if error is not None:
+            outcome["error"] = error
+        outcome["latency_ms"] = round(elapsed_time * 1000, 2)
+        outcome["checked_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        outcome["source"] = source
+        self._last_outcome = outcome
+        self._last_outcome_at = time.monotonic()
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logging.info("Upstream HTTP client closed.")
+        self._client = None
+
+
+upstream_client = UpstreamClient()
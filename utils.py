@@ -1,3 +1,6 @@
+import asyncio
+import logging
+
 class WeatherAppException(Exception):
     """Custom exception for the Weather App."""
     def __init__(self, message, error_code=None):
@@ -6,3 +9,76 @@ class WeatherAppException(Exception):
 
     def __str__(self):
         return f"{self.args[0]} (Error Code: {self.error_code})" if self.error_code else self.args[0]
+
+class CityNotFoundException(WeatherAppException):
+    """A city the geocoding API doesn't know, named as the user typed it."""
+    def __init__(self, name):
+        super().__init__(f"City '{name}' not found.")
+        self.name = name
+
+def normalize_city(city):
+    """Cache key for a city query: case-folded, with whitespace collapsed around words and commas.
+
+    "  paris", "Paris" and "PARIS" all become "paris", and "Paris ,fr" becomes "paris, fr".
+    """
+    parts = (" ".join(part.split()) for part in city.casefold().split(","))
+    return ", ".join(part for part in parts if part)
+
+def split_country_code(city_key):
+    """Split a normalized "name, cc" key into ("name", "CC"); other keys have no country code."""
+    name, _, suffix = city_key.rpartition(", ")
+    if name and len(suffix) == 2 and suffix.isalpha():
+        return name, suffix.upper()
+    return city_key, None
+
+async def gather_bounded(funcs, limit, timeout):
+    """Run zero-argument coroutine functions concurrently, at most `limit` at a time.
+
+    Each call is given `timeout` seconds. Results are returned in input order; a call
+    that fails or times out yields its exception instead of aborting the others.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(func):
+        async with semaphore:
+            return await asyncio.wait_for(func(), timeout)
+
+    return await asyncio.gather(*(run(func) for func in funcs), return_exceptions=True)
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight call.
+
+    Every caller waiting on a key receives the same result, or the same exception.
+    """
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args):
+        future = self._calls.get(key)
+        if future is None:
+            future = self._launch(key, func, *args)
+        else:
+            logging.debug("Joining in-flight call for %s", key)
+        return await asyncio.shield(future)
+
+    def start(self, key, func, *args):
+        """Start a call in the background unless one is already in flight for `key`.
+
+        Returns True if a new call was started. Callers of `do` with the same key join it.
+        """
+        if key in self._calls:
+            return False
+        self._launch(key, func, *args)
+        return True
+
+    def _launch(self, key, func, *args):
+        future = asyncio.ensure_future(func(*args))
+        self._calls[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()